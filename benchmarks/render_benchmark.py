@@ -0,0 +1,224 @@
+"""
+Headless benchmark of the gameplay render path.
+
+Runs GameplayMode under SDL's dummy video driver with a fixed seed and a scripted player, for several resolutions,
+lane counts and with neon on and off, then prints the per-stage timings (in milliseconds) as JSON. With --replay,
+a recorded run (see gameplay/replays.py) is played back instead, so a real player's session is the load profile.
+
+usage (from the repo's root directory):
+    python -m benchmarks.render_benchmark --frames 300 --output bench.json
+"""
+import os
+
+# these need to be set before pygame initializes its display and mixer
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import argparse
+import json
+import random
+import sys
+import time
+
+import numpy
+import pygame
+
+import config
+import util.profiling as profiling
+
+
+def _summarize(samples_ms):
+    if len(samples_ms) == 0:
+        return None
+    p50, p95, p99 = numpy.percentile(samples_ms, (50, 95, 99)).tolist()
+    return {
+        "mean": float(samples_ms.mean()),
+        "p50": p50,
+        "p95": p95,
+        "p99": p99,
+        "max": float(samples_ms.max()),
+    }
+
+
+def run_one(
+    loop, resolution, lanes, use_neon, n_frames, n_warmup_frames, seed, dt, replay=None
+):
+    """
+    :param replay: if given, its inputs (and level) are played back, from the start again whenever it ends or the
+                   player dies, instead of the scripted player's. lanes, seed and dt are ignored then.
+    """
+    import gameplay.gamestuff as gamestuff
+    import gameplay.levels as levels
+    import gameplay.replays as replays
+    import gameplay.simulation as simulation
+
+    pygame.display.set_mode(resolution)
+    loop.screen = pygame.display.get_surface()
+    config.Debug.use_neon = use_neon
+    random.seed(seed)
+    run_count = 0
+
+    def new_run():
+        nonlocal run_count, replay_tick
+        run_count += 1
+        if replay is not None:
+            replay_tick = 0
+            return replays.create_replay_mode(loop, replay)
+        # a new level for every run, otherwise the bot would die at the same spot over and over
+        return gamestuff.GameplayMode(
+            loop, level=levels.InfiniteGeneratingLevel(lanes, seed=seed + run_count - 1)
+        )
+
+    replay_tick = 0
+    mode = new_run()
+    bot = simulation.ScriptedBot()
+    timer = profiling.get_frame_timer()
+    timer.history = n_frames
+    timer.enabled = True
+    timer.clear()
+
+    deaths = 0
+    total_time = 0
+    for i in range(n_warmup_frames + n_frames):
+        if i == n_warmup_frames:
+            timer.clear()
+            total_time = 0
+
+        t0 = time.perf_counter()
+        with timer.stage("frame"):
+            with timer.stage("update"):
+                if replay is not None:
+                    mode.update_world(*replay.get_tick_input(replay_tick))
+                    replay_tick += 1
+                else:
+                    mode.update_world(
+                        dt, bot.get_events(mode.player, mode.current_level)
+                    )
+            with timer.stage("draw"):
+                mode.draw_to_screen(loop.screen)
+        total_time += time.perf_counter() - t0
+        timer.end_frame()
+
+        if mode.player.is_dead():
+            deaths += 1
+            mode = new_run()
+        elif replay is not None and replay_tick >= len(replay):
+            mode = new_run()
+
+    timer.enabled = False
+    return {
+        "resolution": list(resolution),
+        "lanes": lanes if replay is None else replay.n_lanes,
+        "neon": use_neon,
+        "frames": n_frames,
+        "fps": n_frames / total_time if total_time > 0 else None,
+        "deaths": deaths,
+        "distance": mode.player.z,
+        "stages": {
+            name: _summarize(timer.get_samples(name))
+            for name in timer.get_stage_names()
+        },
+    }
+
+
+def _parse_resolution(text):
+    w, h = text.lower().split("x")
+    return int(w), int(h)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--warmup", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=12345)
+    parser.add_argument("--dt", type=float, default=1 / 60, help="seconds per frame")
+    parser.add_argument(
+        "--resolutions",
+        default="600x300,960x540,1820x1080",
+        help="comma separated, e.g. 960x540,1820x1080",
+    )
+    parser.add_argument("--lanes", default="6,9,12", help="comma separated")
+    parser.add_argument(
+        "--neon", default="on,off", help="'on', 'off' or 'on,off' (the default)"
+    )
+    parser.add_argument(
+        "--replay",
+        help="a recorded run to play back instead of the scripted player (--lanes is ignored then)",
+    )
+    parser.add_argument("--output", help="file to write the results to")
+    args = parser.parse_args(argv)
+
+    resolutions = [_parse_resolution(r) for r in args.resolutions.split(",")]
+    lane_counts = [int(n) for n in args.lanes.split(",")]
+    replay = None
+    if args.replay:
+        import gameplay.replays as replays
+
+        replay = replays.Replay.load(args.replay)
+        lane_counts = [replay.n_lanes]
+    neon_modes = [mode.strip() == "on" for mode in args.neon.split(",")]
+
+    pygame.init()
+    config.Music.enabled = False
+    config.Sound.enabled = False
+    pygame.display.set_mode(resolutions[0])
+
+    import main as game_main
+    import rendering.levelbuilder3d as levelbuilder3d
+    from sound_manager.SoundManager import SoundManager
+
+    SoundManager.init()
+    levelbuilder3d.load_player_art()
+    loop = game_main.GameLoop()
+
+    results = []
+    for resolution in resolutions:
+        for lanes in lane_counts:
+            for use_neon in neon_modes:
+                result = run_one(
+                    loop,
+                    resolution,
+                    lanes,
+                    use_neon,
+                    args.frames,
+                    args.warmup,
+                    args.seed,
+                    args.dt,
+                    replay=replay,
+                )
+                print(
+                    "INFO: {}x{}, {} lanes, neon {}: {:.1f} fps".format(
+                        resolution[0],
+                        resolution[1],
+                        lanes,
+                        "on" if use_neon else "off",
+                        result["fps"] or 0,
+                    ),
+                    file=sys.stderr,
+                )
+                results.append(result)
+
+    output = {
+        "settings": {
+            "frames": args.frames,
+            "warmup": args.warmup,
+            "seed": args.seed,
+            "dt": args.dt,
+            "replay": args.replay,
+            "bloom_downsample": config.Display.bloom_downsample,
+        },
+        "results": results,
+    }
+    text = json.dumps(output, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+        print(
+            "INFO: saved benchmark results to: {}".format(args.output), file=sys.stderr
+        )
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
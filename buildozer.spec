@@ -13,7 +13,7 @@ package.domain = org.bydariogamer
 source.dir = .
 
 # (list) Source files to include (let empty to include all the files)
-source.include_exts = py,png,jpg,kv,atlas,ttf,ogg,wav,json
+source.include_exts = py,png,jpg,kv,atlas,ttf,ogg,wav,json,npy
 
 # (list) List of inclusions using pattern matching
 #source.include_patterns = assets/*
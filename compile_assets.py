@@ -0,0 +1,24 @@
+import os
+
+import rendering.levelbuilder3d as levelbuilder3d
+
+_ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _get_path(relative_path):
+    """:return: the absolute path of a file, given its path relative to the repo's root"""
+    return os.path.join(_ROOT_DIR, relative_path)
+
+
+def do_it():
+    """Precompiles the assets that are slow to load from their source files. The game falls back to the source
+    files when the compiled versions are missing or out of date, so this is optional (but speeds up startup)."""
+    levelbuilder3d.compile_player_art(
+        path=_get_path(levelbuilder3d.PLAYER_ART_CACHE_PATH),
+        index_path=_get_path(levelbuilder3d.PLAYER_ART_CACHE_INDEX_PATH),
+        art_dir=_get_path(levelbuilder3d.PLAYER_ART_DIR),
+    )
+
+
+if __name__ == "__main__":
+    do_it()
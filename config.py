@@ -1,4 +1,5 @@
 import os
+import sys
 
 import pygame
 import json
@@ -15,6 +16,8 @@ class Display:
     camera_bob = True
     use_player_art = True
     depth_shade = False
+    bloom_downsample = 1  # 1 = full resolution bloom, 2 = half, 4 = quarter
+    physics_fps = 120  # gameplay simulation steps per second, 0 = one (variable length) step per frame
 
 
 class FontSize:
@@ -39,6 +42,8 @@ class Debug:
     use_neon = True
     fps_test = False
     jumping_enemies = False
+    prefetch_level = True
+    record_replays = False  # saves each run's inputs to the replays directory (see gameplay/replays.py)
     flag = False
 
 
@@ -63,6 +68,8 @@ class KeyBinds:
         profiler = [pygame.K_F1]
         fps = [pygame.K_F2]
         flag = [pygame.K_F3]
+        frame_timer = [pygame.K_F4]
+        export_frame_times = [pygame.K_F5]
 
 
 class Platform:
@@ -70,6 +77,7 @@ class Platform:
     IS_WINDOWS = platform.system() == "Windows"
     IS_LINUX = platform.system() == "Linux"
     IS_MAC = platform.system() == "Darwin"
+    IS_FROZEN = getattr(sys, "frozen", False)  # running from a PyInstaller build
 
 
 if Platform.IS_ANDROID:
@@ -86,6 +94,8 @@ _default_configs = {
         "camera_bob": True,
         "use_player_art": True,
         "depth_shade": False,
+        "bloom_downsample": 1,
+        "physics_fps": 120,
     },
     "FontSize": {"title": 64, "option": 36, "info": 24, "score": 30},
     "Music": {"enabled": True, "volume": 0.5},
@@ -131,6 +141,12 @@ def _apply_configs_from_json(configuration):
     Display.camera_bob = configuration["Display"]["camera_bob"]
     Display.use_player_art = configuration["Display"]["use_player_art"]
     Display.depth_shade = configuration["Display"]["depth_shade"]
+    Display.bloom_downsample = configuration["Display"].get(
+        "bloom_downsample", _default_configs["Display"]["bloom_downsample"]
+    )
+    Display.physics_fps = configuration["Display"].get(
+        "physics_fps", _default_configs["Display"]["physics_fps"]
+    )
     FontSize.title = configuration["FontSize"]["title"]
     FontSize.option = configuration["FontSize"]["option"]
     FontSize.info = configuration["FontSize"]["info"]
@@ -171,6 +187,8 @@ def _get_configs_as_json_dict():
     configuration["Display"]["camera_bob"] = Display.camera_bob
     configuration["Display"]["use_player_art"] = Display.use_player_art
     configuration["Display"]["depth_shade"] = Display.depth_shade
+    configuration["Display"]["bloom_downsample"] = Display.bloom_downsample
+    configuration["Display"]["physics_fps"] = Display.physics_fps
     configuration["FontSize"]["title"] = FontSize.title
     configuration["FontSize"]["option"] = FontSize.option
     configuration["FontSize"]["info"] = FontSize.info
@@ -9,15 +9,22 @@ import rendering.threedee as threedee
 import rendering.levelbuilder3d as levelbuilder3d
 import util.utility_functions as utility_functions
 import util.fonts as fonts
+import util.profiling as profiling
 import gameplay.highscores as highscores
+import gameplay.replays as replays
 from sound_manager.SoundManager import SoundManager
 
 
 class GameplayMode(main.GameMode):
-    def __init__(self, loop):
+    def __init__(self, loop, level=None):
+        """
+        :param level: the level to play, a new random one with 9 lanes if None
+        """
         super().__init__(loop)
         self.player = player2d.Player()
-        self.current_level = levels.InfiniteGeneratingLevel(9)
+        self.current_level = (
+            level if level is not None else levels.InfiniteGeneratingLevel(9)
+        )
 
         self.camera_min_y = -1  # camera y when player is grounded
         self.camera_max_y = 1  # camera y when player is at max jump height
@@ -33,30 +40,105 @@ class GameplayMode(main.GameMode):
         self.current_rotation = 0
 
         self.foresight = 150
+        self.prefetch_distance = (
+            500  # how far ahead of the player to generate the level in the background
+        )
         self.neon_renderer = neon.NeonRenderer()
+        self._lines_3d = threedee.LineBatch3D()  # reused every frame
 
         self.score_font = fonts.get_font(30, name="cool")
+        self.score_atlas = fonts.get_glyph_atlas(self.score_font, False, neon.LIME)
         self.update_level_rotation(1000, snap=True)
+        self._prev_render_state = None  # the render state before the last update
+
+        self.replay_recorder = None
+        if config.Debug.record_replays:
+            self.replay_recorder = replays.Replay(
+                self.current_level.seed,
+                self.current_level.number_of_lanes(),
+                fixed_dt=self.get_fixed_timestep(),
+            )
 
     def on_mode_start(self):
         SoundManager.play_song("game_theme", fadeout_ms=250, fadein_ms=1000)
 
-    def update(self, dt, events):
-        self.handle_events(events)
-        self.player.update(dt, self.current_level, events)
+    def on_mode_end(self):
+        self.render_alpha = (
+            1.0  # so menus drawn on top of the game show its latest state
+        )
 
-        self.update_camera_position(dt)
-        self.update_level_rotation(dt)
+    def get_fixed_timestep(self):
+        if config.Display.physics_fps > 0:
+            return 1 / config.Display.physics_fps
+        else:
+            return None
+
+    def get_render_state(self):
+        """:return: everything that's drawn and moves smoothly, in a form that can be interpolated."""
+        return (
+            self.player.z,
+            self.player.y,
+            self.camera.position.z,
+            self.camera.position.y,
+            self.current_level.get_rotation(self.player.z),
+        )
 
-        self.current_level.unload_obstacles(self.camera.position.z + self.unload_offset)
+    def set_render_state(self, state):
+        (
+            self.player.z,
+            self.player.y,
+            self.camera.position.z,
+            self.camera.position.y,
+            rotation,
+        ) = state
+        self.current_level.set_rotation(rotation)
+
+    def get_interpolated_render_state(self, alpha):
+        """:return: the render state, alpha of the way from before the last update to now."""
+        cur_state = self.get_render_state()
+        if self._prev_render_state is None or alpha >= 1:
+            return cur_state
+        res = [
+            utility_functions.lerp(alpha, prev, cur)
+            for prev, cur in zip(self._prev_render_state[:-1], cur_state[:-1])
+        ]
+        prev_rot, cur_rot = self._prev_render_state[-1], cur_state[-1]
+        res.append(prev_rot + alpha * ((cur_rot - prev_rot + 180) % 360 - 180))
+        return tuple(res)
+
+    def update(self, dt, events):
+        self._prev_render_state = self.get_render_state()
+        self.handle_events(events)
+        pressed = pygame.key.get_pressed()
+        if self.replay_recorder is not None:
+            self.replay_recorder.record_tick(dt, events, pressed)
+        self.update_world(dt, events, pressed)
 
         if self.player.is_dead():
+            if self.replay_recorder is not None:
+                self.replay_recorder.save()
             score = self.player.get_score()
             highscores.add_new_score(score)
             self.loop.set_mode(
                 RetryMenu(self.loop, score, self.player.get_death_message(), self)
             )
 
+    def update_world(self, dt, events, pressed=None):
+        """Advances the player, camera and level by dt (without reacting to the player dying).
+
+        :param pressed: the state of the keyboard, read from pygame if None (see Player.update)
+        """
+        self.player.update(dt, self.current_level, events, pressed)
+
+        self.update_camera_position(dt)
+        self.update_level_rotation(dt)
+
+        self.current_level.unload_obstacles(self.camera.position.z + self.unload_offset)
+        if config.Debug.prefetch_level:
+            self.current_level.load_obstacles(
+                self.player.z, self.player.z + self.prefetch_distance
+            )
+
     def handle_events(self, events):
         for e in events:
             if e.type == pygame.KEYDOWN:
@@ -105,34 +187,48 @@ class GameplayMode(main.GameMode):
                 self.current_level.set_rotation(cur_rotation + change_in_rotation)
 
     def draw_to_screen(self, screen, extra_darkness_factor=1, show_score=True):
+        if self.render_alpha >= 1:
+            self._draw_to_screen(screen, extra_darkness_factor, show_score)
+        else:
+            # draw the interpolated state, then put the simulation's state back
+            cur_state = self.get_render_state()
+            self.set_render_state(self.get_interpolated_render_state(self.render_alpha))
+            try:
+                self._draw_to_screen(screen, extra_darkness_factor, show_score)
+            finally:
+                self.set_render_state(cur_state)
+
+    def _draw_to_screen(self, screen, extra_darkness_factor, show_score):
+        timer = profiling.get_frame_timer()
         screen.fill((0, 0, 0))
-        all_lines = []
+        all_lines = self._lines_3d
+        all_lines.clear()
         cell_length = self.current_level.get_cell_length()
         z = self.camera.position.z
         n_lanes = self.current_level.number_of_lanes()
-        cell_start = int(z / cell_length)
-        cell_end = int((z + self.foresight) / cell_length + 1)
 
-        for i in range(cell_start, cell_end):
-            all_lines.extend(
-                levelbuilder3d.build_section(
-                    i * cell_length, cell_length, self.current_level
-                )
+        with timer.stage("geometry"):
+            levelbuilder3d.build_tunnel(
+                z, z + self.foresight, cell_length, self.current_level, out=all_lines
             )
 
-        for n in range(n_lanes):
-            obstacles = self.current_level.get_all_obstacles_between(
-                n, z, z + self.foresight
-            )
-            for obs in reversed(obstacles):
+            obstacles = []
+            for n in range(n_lanes):
                 # add them from from back to front so they overlap properly
-                all_lines.extend(
-                    levelbuilder3d.build_obstacle(obs, self.current_level, self.player)
+                obstacles.extend(
+                    reversed(
+                        self.current_level.get_all_obstacles_between(
+                            n, z, z + self.foresight
+                        )
+                    )
                 )
+            levelbuilder3d.build_obstacles(
+                obstacles, self.current_level, self.player, out=all_lines
+            )
 
-        all_lines.extend(
-            levelbuilder3d.get_player_shape(self.player, self.current_level)
-        )
+            levelbuilder3d.get_player_shape(
+                self.player, self.current_level, out=all_lines
+            )
 
         if config.Display.depth_shade:
             # sorry tank, I just think it's a cool option <3
@@ -140,20 +236,88 @@ class GameplayMode(main.GameMode):
         else:
             depth_shading = None
 
-        all_2d_lines = self.camera.project_to_surface(
-            screen, all_lines, depth_shading=depth_shading
-        )
-        neon_lines = neon.NeonLine.convert_line2ds_to_neon_lines(all_2d_lines)
+        with timer.stage("projection"):
+            all_2d_lines = self.camera.project_batch_to_surface(
+                screen, all_lines, depth_shading=depth_shading
+            )
 
-        self.neon_renderer.draw_lines(
-            screen, neon_lines, extra_darkness_factor=extra_darkness_factor
-        )
+        with timer.stage("neon"):
+            self.neon_renderer.draw_lines(
+                screen, all_2d_lines, extra_darkness_factor=extra_darkness_factor
+            )
 
         if show_score:
-            screen.blit(
-                self.score_font.render(str(self.player.get_score()), False, neon.LIME),
-                (20, 20),
+            with timer.stage("hud"):
+                self.draw_hud(screen)
+
+    def draw_hud(self, screen):
+        self.score_atlas.draw(screen, str(self.player.get_score()), (20, 20))
+
+    def is_animating(self):
+        """:return: whether the game would look different if it was drawn again, even without being updated"""
+        return (
+            self.player.is_dead()
+            and self.player.get_time_dead() <= levelbuilder3d.EXPLOSION_DURATION
+        )
+
+
+class FrozenGameplayBackground:
+    """A snapshot of a GameplayMode's frame, for the menus that are drawn over a stopped game. It gets darkened
+    the same way the neon renderer would darken the game, which is much cheaper than drawing the game again
+    every frame. It's only redrawn while the game is still animating (the player's explosion)."""
+
+    def __init__(self, gameplay_mode: GameplayMode, show_score=True):
+        self.gameplay_mode = gameplay_mode
+        self.show_score = show_score
+        self._snapshot = None  # the game's frame, without any darkness or the score
+        self._snapshot_used_neon = None
+        self._darkened = None  # the snapshot, darkened by _darkened_factor
+        self._darkened_factor = None
+
+    def draw(self, screen: pygame.Surface, extra_darkness_factor=1):
+        mode = self.gameplay_mode
+        if mode.is_animating():
+            self._snapshot = None
+            mode.draw_to_screen(
+                screen,
+                extra_darkness_factor=extra_darkness_factor,
+                show_score=self.show_score,
             )
+            return
+
+        if (
+            self._snapshot is None
+            or self._snapshot.get_size() != screen.get_size()
+            or self._snapshot_used_neon != config.Debug.use_neon
+        ):
+            self._snapshot = screen.copy()
+            # darkening rounds each channel down to a multiple of 100 before scaling it, so darkening the frame twice
+            # isn't the same as darkening it once by the product. the snapshot is drawn without any darkness, and
+            # the renderer's darkness_factor gets applied along with the extra darkness below.
+            darkness_factor = mode.neon_renderer.darkness_factor
+            mode.neon_renderer.darkness_factor = 1
+            try:
+                mode.draw_to_screen(self._snapshot, show_score=False)
+            finally:
+                mode.neon_renderer.darkness_factor = darkness_factor
+            self._snapshot_used_neon = config.Debug.use_neon
+            self._darkened = screen.copy()
+            self._darkened_factor = None
+
+        if config.Debug.use_neon:
+            factor = mode.neon_renderer.darkness_factor * extra_darkness_factor
+        else:
+            factor = 1  # only the neon renderer darkens things
+        if factor != self._darkened_factor:
+            darkened = pygame.surfarray.pixels3d(self._darkened)
+            darkened[...] = pygame.surfarray.pixels3d(self._snapshot)
+            neon.darken(darkened, factor)
+            del darkened  # unlocks the surface
+            self._darkened_factor = factor
+
+        screen.blit(self._darkened, (0, 0))
+        if self.show_score:
+            mode.draw_hud(screen)
 
 
 class PauseMenu(main.GameMode):
@@ -169,21 +333,23 @@ class PauseMenu(main.GameMode):
         self.title_font = fonts.get_font(config.FontSize.title)
         self.option_font = fonts.get_font(config.FontSize.option)
 
-        self.options_rects = []
-        option_y = config.Display.height // 2
-        for i in range(len(self.options)):
-            option_size = self.option_font.size(self.options[i][0].upper())
-            self.options_rects.append(
-                pygame.Rect(
-                    config.Display.width // 2 - option_size[0] // 2,
-                    option_y,
-                    option_size[0],
-                    option_size[1],
-                )
+        # get the title's and options' text positions
+        self.layout = fonts.MenuLayout(config.Display.width)
+        title_size = self.title_font.size("PAUSE")
+        title_y = config.Display.height // 3 - title_size[1] // 2
+        self.layout.add_line(self.title_font, "PAUSE", title_y, neon.WHITE)
+        option_y = max(config.Display.height // 2, title_y + title_size[1])
+        self.option_lines = []
+        for option_text, _ in self.options:
+            line = self.layout.add_line(
+                self.option_font, option_text.upper(), option_y, neon.WHITE
             )
-            option_y += option_size[1]
+            self.option_lines.append(line)
+            option_y = self.layout.get_rect(line).bottom
+        self.options_rects = [self.layout.get_rect(line) for line in self.option_lines]
 
         self.pause_timer = 0  # how long we've been paused
+        self.background = FrozenGameplayBackground(gameplay_mode)
 
     def on_mode_start(self):
         SoundManager.play("blip2")
@@ -243,32 +409,12 @@ class PauseMenu(main.GameMode):
         )
 
         # drawing level underneath this menu
-        self.gameplay_mode.draw_to_screen(
-            screen, extra_darkness_factor=current_darkness
-        )
-
-        screen_size = screen.get_size()
-        title_surface = self.title_font.render("PAUSE", True, neon.WHITE)
+        self.background.draw(screen, extra_darkness_factor=current_darkness)
 
-        title_size = title_surface.get_size()
-        title_y = screen_size[1] // 3 - title_size[1] // 2
-        screen.blit(
-            title_surface, dest=(screen_size[0] // 2 - title_size[0] // 2, title_y)
-        )
-
-        option_y = max(screen_size[1] // 2, title_y + title_size[1])
-        for i in range(len(self.options)):
-            option_text = self.options[i][0]
+        for i, line in enumerate(self.option_lines):
             is_selected = i == self.selected_option_idx
-            color = neon.WHITE if not is_selected else neon.RED
-
-            option_surface = self.option_font.render(option_text.upper(), True, color)
-            option_size = option_surface.get_size()
-            screen.blit(
-                option_surface,
-                dest=(screen_size[0] // 2 - option_size[0] // 2, option_y),
-            )
-            option_y += option_size[1]
+            self.layout.set_color(line, neon.WHITE if not is_selected else neon.RED)
+        self.layout.draw(screen)
 
 
 class RetryMenu(main.GameMode):
@@ -282,7 +428,6 @@ class RetryMenu(main.GameMode):
             ("retry", lambda: self.retry_pressed()),
             ("exit", lambda: self.exit_pressed()),
         ]
-        self.options_rects = []
 
         self.title_font: pygame.font.Font = fonts.get_font(config.FontSize.title)
         self.option_font: pygame.font.Font = fonts.get_font(config.FontSize.option)
@@ -290,31 +435,31 @@ class RetryMenu(main.GameMode):
 
         self.death_message = death_message
 
-        # get options' text positions
-        screen_size = (config.Display.width, config.Display.height)
+        # get the texts' positions
+        self.layout = fonts.MenuLayout(config.Display.width)
         title_size = self.title_font.size("GAME OVER")
-        title_y = screen_size[1] // 3 - title_size[1] // 2
+        title_y = config.Display.height // 3 - title_size[1] // 2
+        self.layout.add_line(self.title_font, "GAME OVER", title_y, neon.WHITE)
         cur_y = title_y + int(title_size[1] * 0.9)
-        death_msg_size = self.info_font.size(self.death_message.upper())
-        cur_y += int(death_msg_size[1] * 2)
-        subtitle_surface1_size = self.info_font.size("SCORE: {}".format(self.score))
-        cur_y += subtitle_surface1_size[1]
-        subtitle_surface2_size = self.info_font.size("BEST: {}".format(self.best_score))
-        cur_y += int(subtitle_surface2_size[1] * 2)
-        option_y = max(screen_size[1] // 2, cur_y)
-        for i in range(len(self.options)):
-            option_size = self.option_font.size(self.options[i][0].upper())
-            self.options_rects.append(
-                pygame.Rect(
-                    screen_size[0] // 2 - option_size[0] // 2,
-                    option_y,
-                    option_size[0],
-                    option_size[1],
-                )
+        for text, spacing in (
+            (self.death_message.upper(), 2),
+            ("SCORE: {}".format(self.score), 1),
+            ("BEST: {}".format(self.best_score), 2),
+        ):
+            line = self.layout.add_line(self.info_font, text, cur_y, neon.WHITE)
+            cur_y += int(self.layout.get_rect(line).height * spacing)
+        option_y = max(config.Display.height // 2, cur_y)
+        self.option_lines = []
+        for option_text, _ in self.options:
+            line = self.layout.add_line(
+                self.option_font, option_text.upper(), option_y, neon.WHITE
             )
-            option_y += option_size[1]
+            self.option_lines.append(line)
+            option_y = self.layout.get_rect(line).bottom
+        self.options_rects = [self.layout.get_rect(line) for line in self.option_lines]
 
         self.pause_timer = 0  # how long we've been paused
+        self.background = FrozenGameplayBackground(gameplay_mode, show_score=False)
 
     def on_mode_start(self):
         SoundManager.set_song_volume_multiplier(0.5)
@@ -377,60 +522,9 @@ class RetryMenu(main.GameMode):
         # TODO fade underlying level to a color, for coolness
 
         # drawing level underneath this menu
-        self.gameplay_mode.draw_to_screen(
-            screen, extra_darkness_factor=current_darkness, show_score=False
-        )
-
-        screen_size = screen.get_size()
-
-        title_surface = self.title_font.render("GAME OVER", True, neon.WHITE)
-        title_size = title_surface.get_size()
-        title_y = screen_size[1] // 3 - title_size[1] // 2
-        screen.blit(
-            title_surface, dest=(screen_size[0] // 2 - title_size[0] // 2, title_y)
-        )
-        cur_y = title_y + int(title_size[1] * 0.9)
-
-        death_msg_surface = self.info_font.render(
-            self.death_message.upper(), True, neon.WHITE
-        )
-        death_msg_size = death_msg_surface.get_size()
-        screen.blit(
-            death_msg_surface,
-            dest=(screen_size[0] // 2 - death_msg_size[0] // 2, cur_y),
-        )
-        cur_y += int(death_msg_size[1] * 2)
+        self.background.draw(screen, extra_darkness_factor=current_darkness)
 
-        subtitle_surface1 = self.info_font.render(
-            "SCORE: {}".format(self.score), True, neon.WHITE
-        )
-        subtitle_surface1_size = subtitle_surface1.get_size()
-        screen.blit(
-            subtitle_surface1,
-            dest=(screen_size[0] // 2 - subtitle_surface1_size[0] // 2, cur_y),
-        )
-        cur_y += subtitle_surface1_size[1]
-
-        subtitle_surface2 = self.info_font.render(
-            "BEST: {}".format(self.best_score), True, neon.WHITE
-        )
-        subtitle_surface2_size = subtitle_surface2.get_size()
-        screen.blit(
-            subtitle_surface2,
-            dest=(screen_size[0] // 2 - subtitle_surface2_size[0] // 2, cur_y),
-        )
-        cur_y += int(subtitle_surface2_size[1] * 2)
-
-        option_y = max(screen_size[1] // 2, cur_y)
-        for i in range(len(self.options)):
-            option_text = self.options[i][0]
+        for i, line in enumerate(self.option_lines):
             is_selected = i == self.selected_option_idx
-            color = neon.WHITE if not is_selected else neon.RED
-
-            option_surface = self.option_font.render(option_text.upper(), True, color)
-            option_size = option_surface.get_size()
-            screen.blit(
-                option_surface,
-                dest=(screen_size[0] // 2 - option_size[0] // 2, option_y),
-            )
-            option_y += option_size[1]
+            self.layout.set_color(line, neon.WHITE if not is_selected else neon.RED)
+        self.layout.draw(screen)
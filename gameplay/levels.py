@@ -2,67 +2,183 @@ from typing import List, Optional
 from pygame import Vector3, Color
 from rendering.threedee import Line3D
 import rendering.neon as neon
+import rendering.levelbuilder3d as levelbuilder3d
 from sound_manager.SoundManager import SoundManager
 import util.utility_functions as utils
 import time
 import random
+import bisect
+import collections
+import threading
+import numpy
 
 
-class Obstacle:
-    """Base class for obstacles"""
+class ObstacleType:
+    """Everything that's the same for all the obstacles of one kind. New kinds of obstacles are added by
+    registering new ObstacleTypes (see register_obstacle_type)."""
 
     def __init__(
         self,
-        lane,
-        z,
-        length,
+        name,
         color,
-        can_jump_over,
-        can_slide_through,
+        death_message,
+        model_builder,
+        can_jump_over=False,
+        can_slide_through=False,
         can_run_through=False,
+        should_squeeze=True,
+        should_rise_with_player=False,
+        jump_clearance_height=0.1,
     ):
-        # the lane the obstacle covers
-        self.lane = lane
-
-        # obstacle's position and size in the z-axis
-        self.z = z
-        self.length = length
-
+        """
+        :param model_builder: a function that takes the obstacle's color and returns its model (see get_model)
+        :param should_squeeze: whether the model should be "squeezed" inward as it approaches the center of the level
+        """
+        self.type_id = None  # assigned by register_obstacle_type
+        self.name = name
         self.color = color
-
-        self._can_jump = can_jump_over
-        self._can_slide_through = can_slide_through
-        self._can_run_through = can_run_through
-
-        self._is_dead = False
-        self._dead_since = 0  # time of death, in seconds (since the the epoch)
+        self.death_message = death_message
+        self.model_builder = model_builder
+        self.can_jump_over = can_jump_over
+        self.can_slide_through = can_slide_through
+        self.can_run_through = can_run_through
+        self.should_squeeze = should_squeeze
+        self.should_rise_with_player = should_rise_with_player
+        self.jump_clearance_height = jump_clearance_height
 
         # used to avoid recreating the 3D model every frame
         # will be a List[Line3D] if present
         self._cached_3d_model = None
 
+    def get_model(self) -> List[Line3D]:
+        """
+        :return: a 3D representation of the obstacle, as if its corners were at:
+            [(-1, 1, 0), (1, 1, 0), (1, -1, 0), (-1, -1, 0)],
+            and facing upwards in the z-axis. It's shared by every obstacle of this type, so don't modify it.
+        """
+        if self._cached_3d_model is None:
+            self._cached_3d_model = self.model_builder(self.color)
+
+        return self._cached_3d_model
+
+
+OBSTACLE_TYPES: List[ObstacleType] = []  # type_id -> ObstacleType
+
+
+def register_obstacle_type(obstacle_type: ObstacleType) -> ObstacleType:
+    obstacle_type.type_id = len(OBSTACLE_TYPES)
+    OBSTACLE_TYPES.append(obstacle_type)
+    return obstacle_type
+
+
+class ObstaclePool:
+    """Stores the state of many obstacles in parallel arrays. Obstacles are lightweight views into a pool."""
+
+    def __init__(self, capacity=16):
+        self._size = 0
+        self.lanes = numpy.empty((capacity,), dtype=numpy.int32)
+        self.zs = numpy.empty((capacity,), dtype=numpy.float64)
+        self.lengths = numpy.empty((capacity,), dtype=numpy.float64)
+        self.type_ids = numpy.empty((capacity,), dtype=numpy.int16)
+        self.dead_since = numpy.empty(
+            (capacity,), dtype=numpy.float64
+        )  # time of death, in seconds (since the epoch), or -1 if alive
+
+        # the models aligned to the level's surface, before the level's rotation is applied
+        # each will be a LineBatch3D if present (see levelbuilder3d.build_obstacles)
+        self.cached_aligned_lines = [None] * capacity
+
+        # the models' explosion animations, built the first time they're needed after the obstacles die
+        # each will be a levelbuilder3d.Explosion if present
+        self.cached_explosions = [None] * capacity
+
+    def __len__(self):
+        return self._size
+
+    def capacity(self):
+        return self.zs.shape[0]
+
+    def add(self, type_id, lane, z, length) -> int:
+        """Adds an obstacle to the pool.
+        :return: the obstacle's index in the pool
+        """
+        if self._size == self.capacity():
+            new_capacity = max(16, self.capacity() * 2)
+            for name in ("lanes", "zs", "lengths", "type_ids", "dead_since"):
+                old = getattr(self, name)
+                new = numpy.empty((new_capacity,), dtype=old.dtype)
+                new[: self._size] = old[: self._size]
+                setattr(self, name, new)
+            extra = [None] * (new_capacity - self._size)
+            self.cached_aligned_lines.extend(extra)
+            self.cached_explosions.extend(extra)
+
+        idx = self._size
+        self.lanes[idx] = lane
+        self.zs[idx] = z
+        self.lengths[idx] = length
+        self.type_ids[idx] = type_id
+        self.dead_since[idx] = -1
+        self._size += 1
+        return idx
+
+
+class Obstacle:
+    """Base class for obstacles. It's a view of one obstacle in an ObstaclePool: per-instance state lives in the
+    pool's arrays, and everything else comes from the obstacle's ObstacleType."""
+
+    __slots__ = ("pool", "idx")
+
+    obstacle_type: ObstacleType = None  # subclasses set this to their type
+
+    def __init__(self, lane, z, length, pool=None, obstacle_type=None):
+        """
+        :param pool: the pool to store the obstacle in. If None, the obstacle gets a pool to itself.
+        :param obstacle_type: overrides the class's obstacle_type
+        """
+        if obstacle_type is None:
+            obstacle_type = type(self).obstacle_type
+        self.pool = pool if pool is not None else ObstaclePool(capacity=1)
+        self.idx = self.pool.add(obstacle_type.type_id, lane, z, length)
+
+    @property
+    def lane(self) -> int:
+        """the lane the obstacle covers"""
+        return int(self.pool.lanes[self.idx])
+
+    @property
+    def z(self) -> float:
+        """the obstacle's position in the z-axis"""
+        return float(self.pool.zs[self.idx])
+
+    @property
+    def length(self) -> float:
+        """the obstacle's size in the z-axis"""
+        return float(self.pool.lengths[self.idx])
+
+    def get_type(self) -> ObstacleType:
+        return OBSTACLE_TYPES[self.pool.type_ids[self.idx]]
+
     def get_death_message(self):
-        return "avoid obstacles!"
+        return self.get_type().death_message
 
     def get_color(self):
-        return self.color
+        return self.get_type().color
 
     def should_squeeze(self):
-        return True
+        return self.get_type().should_squeeze
 
     def should_rise_with_player(self):
-        return False
+        return self.get_type().should_rise_with_player
 
     def handle_potential_collision(self, player) -> bool:
         """
         :return: whether the player should die as a result of this collision.
         """
-        if player.is_dead() or self._is_dead:
+        if player.is_dead() or self.is_dead():
             return False
-        if (
-            player.z + player.length / 2 < self.z
-            or self.z + self.length < player.last_z_pos
-        ):
+        z = self.z
+        if player.z + player.length / 2 < z or z + self.length < player.last_z_pos:
             return False
 
         if player.is_jumping():
@@ -84,156 +200,172 @@ class Obstacle:
             return False
 
     def _handle_death(self):
-        if not self._is_dead:
-            self._is_dead = True
+        if not self.is_dead():
             SoundManager.play("kill")
-            self._dead_since = time.time()
+            self.pool.dead_since[self.idx] = time.time()
+            self.pool.cached_aligned_lines[self.idx] = None
+
+    def is_dead(self):
+        return self.pool.dead_since[self.idx] >= 0
 
     def can_jump_over(self):
-        return self._can_jump
+        return self.get_type().can_jump_over
 
     def can_run_through(self):
-        return self._can_run_through
+        return self.get_type().can_run_through
 
     def get_time_dead(self):
-        if self._is_dead:
-            return time.time() - self._dead_since
+        dead_since = self.pool.dead_since[self.idx]
+        if dead_since >= 0:
+            return time.time() - dead_since
         else:
             return -1
 
     def get_jump_clearance_height(self):
-        return 0.1
+        return self.get_type().jump_clearance_height
 
     def can_slide_through(self):
-        return self._can_slide_through
+        return self.get_type().can_slide_through
 
     def get_model(self) -> List[Line3D]:
-        """
-        :return: a 3D representation of the obstacle, as if its corners were at:
-            [(-1, 1, 0), (1, 1, 0), (1, -1, 0), (-1, -1, 0)],
-            and facing upwards in the z-axis.
-        """
-        if self._cached_3d_model is None:
-            self._cached_3d_model = self.generate_3d_model_at_origin()
-
-        return self._cached_3d_model
-
-    def generate_3d_model_at_origin(self) -> List[Line3D]:
-        """Generates the obstacle's 3D model from scratch."""
-        return [
-            # basic square outline
-            Line3D(Vector3(-1, 0, 1), Vector3(1, 0, 1), color=self.get_color()),
-            Line3D(Vector3(1, 0, 1), Vector3(1, 0, -1), color=self.get_color()),
-            Line3D(Vector3(1, 0, -1), Vector3(-1, 0, -1), color=self.get_color()),
-            Line3D(Vector3(-1, 0, -1), Vector3(-1, 0, 1), color=self.get_color()),
-            # 'X' through the middle
-            Line3D(Vector3(-1, 0, 1), Vector3(1, 0, -1), color=self.get_color()),
-            Line3D(Vector3(1, 0, 1), Vector3(-1, 0, -1), color=self.get_color()),
-        ]
+        """:return: the obstacle's model (see ObstacleType.get_model)"""
+        return self.get_type().get_model()
+
+    def get_cached_aligned_lines(self):
+        return self.pool.cached_aligned_lines[self.idx]
+
+    def set_cached_aligned_lines(self, lines):
+        self.pool.cached_aligned_lines[self.idx] = lines
+
+    def get_cached_explosion(self):
+        return self.pool.cached_explosions[self.idx]
+
+    def set_cached_explosion(self, explosion):
+        self.pool.cached_explosions[self.idx] = explosion
+
+
+def build_default_model(color) -> List[Line3D]:
+    return [
+        # basic square outline
+        Line3D(Vector3(-1, 0, 1), Vector3(1, 0, 1), color=color),
+        Line3D(Vector3(1, 0, 1), Vector3(1, 0, -1), color=color),
+        Line3D(Vector3(1, 0, -1), Vector3(-1, 0, -1), color=color),
+        Line3D(Vector3(-1, 0, -1), Vector3(-1, 0, 1), color=color),
+        # 'X' through the middle
+        Line3D(Vector3(-1, 0, 1), Vector3(1, 0, -1), color=color),
+        Line3D(Vector3(1, 0, 1), Vector3(-1, 0, -1), color=color),
+    ]
+
+
+def build_spikes_model(color) -> List[Line3D]:
+    height = 0.2
+    pts = [
+        Vector3(-1, 0, 0),
+        Vector3(-0.8, height, 0),
+        Vector3(-0.4, 0, 0),
+        Vector3(0, height, 0),
+        Vector3(0.4, 0, 0),
+        Vector3(0.8, height, 0),
+        Vector3(1, 0, 0),
+    ]
+    return Line3D.make_lines_from_list(pts, closed=True, color=color)
+
+
+def build_enemy_model(color) -> List[Line3D]:
+    # ooh, scary
+    bot_left = Vector3(-0.5, 0.1, 0)
+    bot_right = Vector3(0.5, 0.1, 0)
+    top_left = Vector3(-0.5, 0.3, 0)
+    top_right = Vector3(0.5, 0.3, 0)
+    outline = Line3D.make_lines_from_list(
+        [bot_left, bot_right, top_right, top_left],
+        closed=True,
+        color=color,
+    )
+    left_eye = Line3D(Vector3(-0.4, 0.25, 0), Vector3(-0.1, 0.2, 0), color=color)
+    right_eye = Line3D(Vector3(0.4, 0.25, 0), Vector3(0.1, 0.2, 0), color=color)
+    mouth = Line3D(Vector3(-0.4, 0.15, 0), Vector3(0.4, 0.15, 0), color=color)
+    return outline + [left_eye, right_eye, mouth]
+
+
+def build_wall_model(color) -> List[Line3D]:
+    height = 0.5
+
+    # TODO do we want something "truly" 3D? it's a bit weird looking
+    # l1 = Vector3(-1, 0, -1)
+    # l2 = Vector3(-1, 0, 1)
+    # r1 = Vector3(1, 0, -1)
+    # r2 = Vector3(1, 0, 1)
+    #
+    # top_left = Vector3(-1, height, 0)
+    # top_right = Vector3(1, height, 0)
+    #
+    # ground_square = Line3D.make_lines_from_list([l1, l2, r2, r1], closed=True, color=color)
+    # front_face = Line3D.make_lines_from_list([l1, top_left, top_right, r1], closed=False, color=color)
+    # extra_lines = [
+    #     Line3D(top_left, l2, color=color),
+    #     Line3D(top_right, r2, color=color),
+    #     Line3D(l1, top_right, color=color),
+    #     Line3D(r1, top_left, color=color)
+    # ]
+    #
+    # return ground_square + front_face + extra_lines
+
+    l1 = Vector3(-1, 0, 0)
+    l2 = Vector3(-1, height, 0)
+    r1 = Vector3(1, 0, 0)
+    r2 = Vector3(1, height, 0)
+
+    return Line3D.make_lines_from_list([l1, l2, r2, r1], closed=True, color=color) + [
+        Line3D(l1, r2, color=color),
+        Line3D(l2, r1, color=color),
+    ]
+
+
+SPIKES = register_obstacle_type(
+    ObstacleType(
+        "spikes",
+        neon.RED,
+        "jump over spikes!",
+        build_spikes_model,
+        can_jump_over=True,
+    )
+)
+
+ENEMY = register_obstacle_type(
+    ObstacleType(
+        "enemy",
+        neon.LIME,
+        "slide through enemies!",
+        build_enemy_model,
+        can_slide_through=True,
+        should_squeeze=False,
+        should_rise_with_player=True,
+    )
+)
+
+WALL = register_obstacle_type(
+    ObstacleType("wall", neon.PURPLE, "avoid walls!", build_wall_model)
+)
 
 
 class Spikes(Obstacle):
-    def __init__(self, lane, z, length):
-        super().__init__(lane, z, length, neon.RED, True, False)
-
-    def get_death_message(self):
-        return "jump over spikes!"
-
-    def generate_3d_model_at_origin(self) -> List[Line3D]:
-        height = 0.2
-        pts = [
-            Vector3(-1, 0, 0),
-            Vector3(-0.8, height, 0),
-            Vector3(-0.4, 0, 0),
-            Vector3(0, height, 0),
-            Vector3(0.4, 0, 0),
-            Vector3(0.8, height, 0),
-            Vector3(1, 0, 0),
-        ]
-        return Line3D.make_lines_from_list(pts, closed=True, color=self.get_color())
+    __slots__ = ()
+    obstacle_type = SPIKES
 
 
 class Enemy(Obstacle):
     """An obstacle you can slide through"""
 
-    def __init__(self, lane, z, length):
-        super().__init__(lane, z, length, neon.LIME, False, True)
-
-    def get_death_message(self):
-        return "slide through enemies!"
-
-    def should_squeeze(self):
-        return False
-
-    def should_rise_with_player(self):
-        return True
-
-    def generate_3d_model_at_origin(self) -> List[Line3D]:
-        # ooh, scary
-        bot_left = Vector3(-0.5, 0.1, 0)
-        bot_right = Vector3(0.5, 0.1, 0)
-        top_left = Vector3(-0.5, 0.3, 0)
-        top_right = Vector3(0.5, 0.3, 0)
-        outline = Line3D.make_lines_from_list(
-            [bot_left, bot_right, top_right, top_left],
-            closed=True,
-            color=self.get_color(),
-        )
-        left_eye = Line3D(
-            Vector3(-0.4, 0.25, 0), Vector3(-0.1, 0.2, 0), color=self.get_color()
-        )
-        right_eye = Line3D(
-            Vector3(0.4, 0.25, 0), Vector3(0.1, 0.2, 0), color=self.get_color()
-        )
-        mouth = Line3D(
-            Vector3(-0.4, 0.15, 0), Vector3(0.4, 0.15, 0), color=self.get_color()
-        )
-        return outline + [left_eye, right_eye, mouth]
+    __slots__ = ()
+    obstacle_type = ENEMY
 
 
 class Wall(Obstacle):
     """An obstacle you can neither slide through nor jump over."""
 
-    def __init__(self, lane, z, length):
-        super().__init__(lane, z, length, neon.PURPLE, False, False)
-
-    def get_death_message(self):
-        return "avoid walls!"
-
-    def generate_3d_model_at_origin(self) -> List[Line3D]:
-        height = 0.5
-
-        # TODO do we want something "truly" 3D? it's a bit weird looking
-        # l1 = Vector3(-1, 0, -1)
-        # l2 = Vector3(-1, 0, 1)
-        # r1 = Vector3(1, 0, -1)
-        # r2 = Vector3(1, 0, 1)
-        #
-        # top_left = Vector3(-1, height, 0)
-        # top_right = Vector3(1, height, 0)
-        #
-        # ground_square = Line3D.make_lines_from_list([l1, l2, r2, r1], closed=True, color=self.get_color())
-        # front_face = Line3D.make_lines_from_list([l1, top_left, top_right, r1], closed=False, color=self.get_color())
-        # extra_lines = [
-        #     Line3D(top_left, l2, color=self.get_color()),
-        #     Line3D(top_right, r2, color=self.get_color()),
-        #     Line3D(l1, top_right, color=self.get_color()),
-        #     Line3D(r1, top_left, color=self.get_color())
-        # ]
-        #
-        # return ground_square + front_face + extra_lines
-
-        l1 = Vector3(-1, 0, 0)
-        l2 = Vector3(-1, height, 0)
-        r1 = Vector3(1, 0, 0)
-        r2 = Vector3(1, height, 0)
-
-        return Line3D.make_lines_from_list(
-            [l1, l2, r2, r1], closed=True, color=self.get_color()
-        ) + [
-            Line3D(l1, r2, color=self.get_color()),
-            Line3D(l2, r1, color=self.get_color()),
-        ]
+    __slots__ = ()
+    obstacle_type = WALL
 
 
 class Level:
@@ -276,6 +408,14 @@ class Level:
         """returns: Obstacles in lane n, between the two z coordinates."""
         return []
 
+    def get_obstacles_overlapping(self, n, z_start, z_end) -> List[Obstacle]:
+        """returns: Obstacles in lane n that overlap [z_start, z_end] along the z-axis (used for collisions)."""
+        return [
+            obs
+            for obs in self.get_all_obstacles_between(n, z_start, z_end)
+            if obs.z <= z_end and z_start <= obs.z + obs.length
+        ]
+
     def load_obstacles(self, z_start, z_end):
         """If necessary, loads (or generates) obstacles between the two z coordinates."""
         pass
@@ -297,6 +437,8 @@ class GenerationParameters:
             (10000, 120),  # 120 is very fast but still playable
             (100000, 200),
         ]  # 200 is insane
+        self.obstacle_chance = 0.333  # chance of each cell having an obstacle
+        self.obstacle_ramp_up = 20  # cells it takes the chance to ramp up from 0
 
     def get_player_speed(self, z):
         if z <= self.speeds[0][0]:
@@ -313,11 +455,141 @@ class GenerationParameters:
                     )
 
 
+_MASK_64 = (1 << 64) - 1
+
+
+def hash_cell(seed: int, n: int, i: int) -> int:
+    """Mixes a level's seed with a (lane, cell) pair into a well-scrambled 64-bit int (using splitmix64's
+    finalizer), so that each cell gets its own independent random stream."""
+    h = (
+        seed * 0x9E3779B97F4A7C15 + n * 0xBF58476D1CE4E5B9 + i * 0x94D049BB133111EB
+    ) & _MASK_64
+    h = ((h ^ (h >> 30)) * 0xBF58476D1CE4E5B9) & _MASK_64
+    h = ((h ^ (h >> 27)) * 0x94D049BB133111EB) & _MASK_64
+    return h ^ (h >> 31)
+
+
+CHUNK_SIZE = 16  # cells per chunk
+
+
+class ObstacleChunk:
+    """The obstacles of CHUNK_SIZE consecutive cells, for every lane. Each lane's obstacles are kept sorted by
+    cell (and z), so that range queries are a pair of bisections and a slice."""
+
+    __slots__ = (
+        "index",
+        "first_cell",
+        "pool",
+        "max_length",
+        "_cells",
+        "_zs",
+        "_z_ends",
+        "_obstacles",
+    )
+
+    def __init__(self, index, n_lanes):
+        self.index = index
+        self.first_cell = index * CHUNK_SIZE
+        self.pool = ObstaclePool()  # the chunk's obstacles' state
+        self.max_length = 0  # length of the chunk's longest obstacle
+        self._cells = [[] for _ in range(n_lanes)]  # lane -> sorted cell indices
+        self._zs = [[] for _ in range(n_lanes)]  # lane -> sorted obstacle z's
+        self._z_ends = [[] for _ in range(n_lanes)]  # lane -> obstacle z + length's
+        self._obstacles = [[] for _ in range(n_lanes)]  # lane -> Obstacles, same order
+
+    def add(self, n, i, obs):
+        """Adds an obstacle to lane n, at cell i. Obstacles must be added in increasing order of cell and z
+        (per lane)."""
+        z, length = obs.z, obs.length
+        self._cells[n].append(i)
+        self._zs[n].append(z)
+        self._z_ends[n].append(z + length)
+        self._obstacles[n].append(obs)
+        self.max_length = max(self.max_length, length)
+
+    def get(self, n, i) -> Optional[Obstacle]:
+        cells = self._cells[n]
+        idx = bisect.bisect_left(cells, i)
+        if idx < len(cells) and cells[idx] == i:
+            return self._obstacles[n][idx]
+
+    def get_all(self) -> List[Obstacle]:
+        return [obs for lane in self._obstacles for obs in lane]
+
+    def get_between(self, n, cell_start, cell_end) -> List[Obstacle]:
+        """:return: lane n's obstacles in cells [cell_start, cell_end)."""
+        cells = self._cells[n]
+        lo = bisect.bisect_left(cells, cell_start)
+        hi = bisect.bisect_left(cells, cell_end, lo)
+        return self._obstacles[n][lo:hi]
+
+    def get_overlapping(self, n, z_start, z_end) -> List[Obstacle]:
+        """:return: lane n's obstacles that overlap [z_start, z_end] along the z-axis."""
+        zs = self._zs[n]
+        lo = bisect.bisect_left(zs, z_start - self.max_length)
+        hi = bisect.bisect_right(zs, z_end, lo)
+        z_ends = self._z_ends[n]
+        return [self._obstacles[n][i] for i in range(lo, hi) if z_ends[i] >= z_start]
+
+
+class ChunkPrefetcher:
+    """Generates a level's chunks ahead of time, on a background thread. It also aligns their obstacles to the
+    level's surface there (see levelbuilder3d.prebuild_obstacles), so that's not done the first time they're drawn.
+
+    The main thread asks for a range of chunks with request(), and picks up the finished ones from `ready`.
+    The thread exits by itself after idle_timeout seconds without requests, and is restarted by the next one.
+    """
+
+    def __init__(self, level, idle_timeout=1.0):
+        self.level = level
+        self.idle_timeout = idle_timeout
+        self.ready = (
+            collections.deque()
+        )  # finished ObstacleChunks (append & popleft are thread-safe)
+
+        self._target = (
+            0,
+            0,
+        )  # [chunk_start, chunk_end), only written by the main thread
+        self._wake = threading.Event()
+        self._thread = None
+        self._next_chunk = None  # only used by the worker thread
+
+    def request(self, chunk_start, chunk_end):
+        self._target = (chunk_start, chunk_end)
+        self._wake.set()
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._run, name="ChunkPrefetcher", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        while self._wake.wait(self.idle_timeout):
+            self._wake.clear()
+            chunk_start, chunk_end = self._target
+            if self._next_chunk is None or self._next_chunk < chunk_start:
+                self._next_chunk = chunk_start
+            while self._next_chunk < chunk_end and self._target[1] == chunk_end:
+                if self._next_chunk not in self.level._chunks:
+                    chunk = self.level._generate_chunk(self._next_chunk)
+                    levelbuilder3d.prebuild_obstacles(chunk.get_all(), self.level)
+                    self.ready.append(chunk)
+                self._next_chunk += 1
+
+
 class InfiniteGeneratingLevel(Level):
-    def __init__(self, lanes, gen_params=None):
+    def __init__(self, lanes, gen_params=None, seed=None):
+        """
+        :param seed: the level's seed. Obstacles only depend on it and on their (lane, cell), so any part of the
+                     level can be (re)generated in any order. If None, a random seed is picked.
+        """
         super().__init__(lanes)
-        self._obstacle_grid = {}  # (lane_n, cell_idx) -> Obstacle
-        self._currently_loaded_cell_range = None  # will be [int, int] if populated
+        self.seed = seed if seed is not None else random.getrandbits(64)
+        self._chunks = {}  # chunk_idx -> ObstacleChunk
+        self._first_kept_chunk = None  # chunks before this one have been unloaded
+        self._max_obstacle_length = 0  # of all the chunks that have been loaded
+        self._prefetcher = None  # will be a ChunkPrefetcher if load_obstacles gets used
         self._gen_params = (
             gen_params if gen_params is not None else GenerationParameters()
         )
@@ -346,57 +618,94 @@ class InfiniteGeneratingLevel(Level):
     def get_player_speed(self, z: float):
         return self._gen_params.get_player_speed(z)
 
-    def _generate_obstacles(self, cell_start, cell_end):
+    def _generate_chunk(self, chunk_idx) -> "ObstacleChunk":
+        chunk = ObstacleChunk(chunk_idx, self.number_of_lanes())
         for n in range(self.number_of_lanes()):
-            for i in range(cell_start, cell_end):
-                obs = self.generate_obstacle_at_cell(n, i)
+            for i in range(chunk.first_cell, chunk.first_cell + CHUNK_SIZE):
+                obs = self.generate_obstacle_at_cell(n, i, pool=chunk.pool)
                 if obs is not None:
-                    self._obstacle_grid[(n, i)] = obs
-
-    def generate_obstacle_at_cell(self, n, i) -> Optional[Obstacle]:
-        """Subclasses can override this to implement custom generation logic."""
+                    chunk.add(n, i, obs)
+        return chunk
+
+    def _get_chunk(self, chunk_idx) -> "ObstacleChunk":
+        """Fetches the given chunk, generating it if it isn't loaded."""
+        chunk = self._chunks.get(chunk_idx)
+        if chunk is None and self._prefetcher is not None:
+            self._take_prefetched_chunks()
+            chunk = self._chunks.get(chunk_idx)
+        if chunk is None:
+            chunk = self._generate_chunk(chunk_idx)
+            self._add_chunk(chunk)
+        return chunk
+
+    def get_cell_random(self, n, i) -> random.Random:
+        """:return: a random number generator that only depends on the level's seed and the given (lane, cell)."""
+        return random.Random(hash_cell(self.seed, n, i))
+
+    def generate_obstacle_at_cell(self, n, i, pool=None) -> Optional[Obstacle]:
+        """Subclasses can override this to implement custom generation logic.
+        The result should only depend on the level's seed, n and i (see get_cell_random).
+
+        :param pool: the ObstaclePool the new obstacle should be stored in
+        """
         if n == 0 and i < 5:
             # don't let obstacles spawn right in your face at the start of a run
             return
 
-        if random.random() < 0.333 * min(1, i / 20):
-            r = random.randint(0, 3)
+        rng = self.get_cell_random(n, i)
+        chance = self._gen_params.obstacle_chance * min(
+            1, i / self._gen_params.obstacle_ramp_up
+        )
+        if rng.random() < chance:
+            r = rng.randint(0, 3)
             cs = self.get_cell_length()
             length = 3
             if r == 0:
-                return Wall(n, (i + 0.5) * cs - length / 2, length)
+                return Wall(n, (i + 0.5) * cs - length / 2, length, pool=pool)
             elif r == 1:
-                return Spikes(n, (i + 0.5) * cs - length / 2, length)
+                return Spikes(n, (i + 0.5) * cs - length / 2, length, pool=pool)
             else:
-                return Enemy(n, (i + 0.5) * cs - length / 2, length)
+                return Enemy(n, (i + 0.5) * cs - length / 2, length, pool=pool)
         else:
             return
 
-    def get_obstacle_at_cell_if_loaded(self, n, i):
-        if (n, i) in self._obstacle_grid:
-            return self._obstacle_grid[(n, i)]
+    def _take_prefetched_chunks(self):
+        ready = self._prefetcher.ready
+        while ready:
+            chunk = ready.popleft()
+            if chunk.index not in self._chunks and (
+                self._first_kept_chunk is None or chunk.index >= self._first_kept_chunk
+            ):
+                self._add_chunk(chunk)
+
+    def _add_chunk(self, chunk):
+        self._chunks[chunk.index] = chunk
+        self._max_obstacle_length = max(self._max_obstacle_length, chunk.max_length)
+
+    def load_obstacles(self, z_start, z_end):
+        """Asks a background thread to generate the chunks between the two z coordinates, so that they're
+        (hopefully) ready by the time they're needed. Chunks that aren't ready yet are still generated
+        on demand by get_all_obstacles_between."""
+        if self._prefetcher is None:
+            self._prefetcher = ChunkPrefetcher(self)
         else:
-            return
+            self._take_prefetched_chunks()
+        cs = self.get_cell_length()
+        self._prefetcher.request(
+            int(z_start / cs) // CHUNK_SIZE, int(z_end / cs) // CHUNK_SIZE + 1
+        )
+
+    def get_obstacle_at_cell_if_loaded(self, n, i):
+        chunk = self._chunks.get(i // CHUNK_SIZE)
+        if chunk is not None:
+            return chunk.get(n % self.number_of_lanes(), i)
 
     def unload_obstacles(self, z_end):
-        cell_end = int(z_end / self.get_cell_length())
-        if (
-            self._currently_loaded_cell_range is None
-            or self._currently_loaded_cell_range[0] >= cell_end
-        ):
-            pass  # nothing to unload
-        else:
-            self._obstacle_grid = {
-                p: self._obstacle_grid[p]
-                for p in self._obstacle_grid
-                if p[1] >= cell_end
-            }
-            if cell_end < self._currently_loaded_cell_range[1]:
-                # we unloaded a portion of the loaded cells
-                self._currently_loaded_cell_range[0] = cell_end
-            else:
-                # we unloaded everything
-                self._currently_loaded_cell_range = None
+        """Unloads the chunks that are entirely before the given z coordinate."""
+        chunk_end = int(z_end / self.get_cell_length()) // CHUNK_SIZE
+        self._first_kept_chunk = chunk_end
+        for chunk_idx in [c for c in self._chunks if c < chunk_end]:
+            del self._chunks[chunk_idx]
 
     def get_all_obstacles_between(self, n, z_start, z_end) -> List[Obstacle]:
         """
@@ -407,35 +716,32 @@ class InfiniteGeneratingLevel(Level):
         cs = self.get_cell_length()
         cell_start = int(z_start / cs)
         cell_end = int(z_end / cs + 1)
+        if cell_end <= cell_start:
+            return []
 
-        new_range = [cell_start, cell_end]
-        old_range = self._currently_loaded_cell_range
-
-        if old_range is None:
-            # starting from scratch
-            self._generate_obstacles(new_range[0], new_range[1])
-            self._currently_loaded_cell_range = [new_range[0], new_range[1]]
-            old_range = self._currently_loaded_cell_range
-        elif new_range[1] <= old_range[0]:
-            # new region is completely before the already-generated region
-            self._generate_obstacles(cell_start, self._currently_loaded_cell_range[0])
-        elif old_range[1] <= new_range[0]:
-            # new region is completely after the already-generated region
-            self._generate_obstacles(self._currently_loaded_cell_range[0], cell_end)
-        elif old_range[0] <= new_range[0] and new_range[1] <= old_range[1]:
-            pass  # we've already generated the requested region
-        else:
-            # new and old regions are overlapping
-            if new_range[0] < old_range[0]:
-                self._generate_obstacles(new_range[0], old_range[0])
-            if old_range[1] < new_range[1]:
-                self._generate_obstacles(old_range[1], new_range[1])
+        chunk_start = cell_start // CHUNK_SIZE
+        chunk_end = (cell_end - 1) // CHUNK_SIZE + 1
+        if chunk_end - chunk_start == 1:
+            return self._get_chunk(chunk_start).get_between(n, cell_start, cell_end)
 
-        self._currently_loaded_cell_range[0] = min(new_range[0], old_range[0])
-        self._currently_loaded_cell_range[1] = max(new_range[1], old_range[1])
+        res = []
+        for chunk_idx in range(chunk_start, chunk_end):
+            res.extend(self._get_chunk(chunk_idx).get_between(n, cell_start, cell_end))
+        return res
 
-        return [
-            self._obstacle_grid[(n, i)]
-            for i in range(cell_start, cell_end)
-            if (n, i) in self._obstacle_grid
-        ]
+    def get_obstacles_overlapping(self, n, z_start, z_end) -> List[Obstacle]:
+        """
+        Fetches the obstacles in the specified lane that overlap [z_start, z_end] along the z-axis, using each
+        chunk's sorted z's. Will generate that portion of the level if necessary.
+        """
+        n = n % self.number_of_lanes()
+        cs = self.get_cell_length()
+        chunk_start = int((z_start - self._max_obstacle_length) // (cs * CHUNK_SIZE))
+        chunk_end = int(z_end // (cs * CHUNK_SIZE)) + 1
+        if chunk_end - chunk_start == 1:
+            return self._get_chunk(chunk_start).get_overlapping(n, z_start, z_end)
+
+        res = []
+        for chunk_idx in range(chunk_start, chunk_end):
+            res.extend(self._get_chunk(chunk_idx).get_overlapping(n, z_start, z_end))
+        return res
@@ -18,8 +18,10 @@ class Player:
         self.dy = 0
         self.modes = ["run", "jump", "slide", "dead"]
         self.current_mode = self.modes[0]
+        self.mode_time = 0  # seconds spent in the current mode
 
         self.last_z_pos = z  # used for collision detection
+        self._lanes_since_last_check = [self.lane]  # also used for collision detection
 
         self._dead_since = 0  # time of death, in seconds since epoch
         self._last_mode_before_death = None
@@ -32,6 +34,7 @@ class Player:
                 self._last_mode_before_death = self.current_mode
 
             self.current_mode = mode
+            self.mode_time = 0
 
     def is_sliding(self):
         return self.current_mode == "slide"
@@ -57,6 +60,9 @@ class Player:
     def get_last_mode_before_death(self):
         return self._last_mode_before_death
 
+    def get_obstacle_that_killed_me(self):
+        return self._obstacle_that_killed_me
+
     def get_death_message(self):
         if self.get_score() < 1000:
             if self._obstacle_that_killed_me is not None:
@@ -86,11 +92,13 @@ class Player:
         if not self.is_dead():
             SoundManager.play("blip")
             self.lane -= 1
+            self._lanes_since_last_check.append(self.lane)
 
     def move_right(self):
         if not self.is_dead():
             SoundManager.play("blip")
             self.lane += 1
+            self._lanes_since_last_check.append(self.lane)
 
     def move_forward(self, dt):
         self.last_z_pos = self.z
@@ -122,11 +130,17 @@ class Player:
     def get_score(self):
         return int(self.z / 10) * 10
 
-    def update(self, dt, level, events):
-        pressed = pygame.key.get_pressed()
+    def update(self, dt, level, events, pressed=None):
+        """
+        :param pressed: the state of the keyboard, as returned by pygame.key.get_pressed(). If None, it's read
+                        from pygame (replays pass in the recorded state instead).
+        """
+        if pressed is None:
+            pressed = pygame.key.get_pressed()
         self._handle_inputs(events, pressed)
         self._handle_collisions(level)
         if not self.is_dead():
+            self.mode_time += dt
             self.set_speed(level.get_player_speed(self.z))
             self._handle_movement(dt, pressed)
 
@@ -171,16 +185,24 @@ class Player:
         if self.is_dead():
             return
         else:
-            lane_n = self.get_lane(level.number_of_lanes())
-            obstacles = level.get_all_obstacles_between(
-                lane_n, self.last_z_pos, self.z + self.length
+            # the player was in all of these lanes while moving from last_z_pos to z (lane changes only happen
+            # between moves), so check them all. Otherwise, you could dodge an obstacle you already ran into.
+            n_lanes = level.number_of_lanes()
+            lanes = dict.fromkeys(
+                lane % n_lanes for lane in self._lanes_since_last_check + [self.lane]
             )
-            for obs in obstacles:
-                if obs.handle_potential_collision(self):
-                    self.set_mode("dead")
-                    SoundManager.play("death")
-                    self._obstacle_that_killed_me = obs
-                    return
+            self._lanes_since_last_check = [self.lane]
+
+            for lane_n in lanes:
+                obstacles = level.get_obstacles_overlapping(
+                    lane_n, self.last_z_pos, self.z + self.length / 2
+                )
+                for obs in obstacles:
+                    if obs.handle_potential_collision(self):
+                        self.set_mode("dead")
+                        SoundManager.play("death")
+                        self._obstacle_that_killed_me = obs
+                        return
 
     def draw(self, display):
         # draw info to display
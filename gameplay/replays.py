@@ -0,0 +1,253 @@
+"""
+Records the inputs of gameplay runs and plays them back.
+
+A replay is the level's seed and number of lanes, followed by one record per simulation tick with the tick's
+key events and the state of the gameplay keys. Since the simulation only depends on those (see GameplayMode's
+update_world), playing them back reproduces the run exactly.
+
+usage (from the repo's root directory):
+    python -m gameplay.replays replays/some_replay.trr [--render]
+"""
+import argparse
+import json
+import os
+import pathlib
+import struct
+import time
+import traceback
+
+import pygame
+
+import config
+
+_MAGIC = b"TRRP"
+_VERSION = 1
+_HEADER = struct.Struct(
+    "<4sHQHd"
+)  # magic, version, level seed, number of lanes, fixed dt (or 0)
+_TICK = struct.Struct("<BB")  # number of events, number of pressed keys
+_TICK_DT = struct.Struct("<d")  # only present if the replay doesn't have a fixed dt
+_EVENT = struct.Struct("<Bi")  # event type, key
+_PRESSED_KEY = struct.Struct("<i")
+
+_EVENT_TYPES = [pygame.KEYDOWN, pygame.KEYUP]  # event type -> its index in the file
+
+REPLAY_DIR = "replays"
+
+
+def get_recorded_keys():
+    """:return: the keys whose pressed state affects gameplay."""
+    return sorted(
+        set(
+            config.KeyBinds.Game.jump
+            + config.KeyBinds.Game.slide
+            + config.KeyBinds.Game.left
+            + config.KeyBinds.Game.right
+        )
+    )
+
+
+class PressedKeys:
+    """Stands in for pygame.key.get_pressed() when playing back a replay."""
+
+    def __init__(self, keys=()):
+        self._keys = frozenset(keys)
+
+    def __getitem__(self, key):
+        return key in self._keys
+
+    def __iter__(self):
+        return iter(self._keys)
+
+
+class Replay:
+    def __init__(self, seed, n_lanes, fixed_dt=None):
+        """
+        :param seed: the level's seed (a non-negative 64-bit int)
+        :param fixed_dt: the dt of every tick, or None if each tick has its own
+        """
+        self.seed = seed
+        self.n_lanes = n_lanes
+        self.fixed_dt = fixed_dt
+        self.ticks = []  # list of (dt, [(event type, key), ...], PressedKeys)
+
+    def __len__(self):
+        return len(self.ticks)
+
+    def get_duration(self):
+        """:return: how long the run lasted, in seconds of game time"""
+        return sum(dt for dt, _, _ in self.ticks)
+
+    def record_tick(self, dt, events, pressed):
+        """Records one simulation tick's input.
+
+        :param events: the tick's pygame events (only key presses and releases are kept)
+        :param pressed: the state of the keyboard, as returned by pygame.key.get_pressed()
+        """
+        self.ticks.append(
+            (
+                dt,
+                [(e.type, e.key) for e in events if e.type in _EVENT_TYPES],
+                PressedKeys(k for k in get_recorded_keys() if pressed[k]),
+            )
+        )
+
+    def get_tick_input(self, i):
+        """:return: (dt, events, pressed) of the given tick, in the same form GameplayMode.update_world takes them"""
+        dt, events, pressed = self.ticks[i]
+        return (
+            dt,
+            [pygame.event.Event(event_type, key=key) for event_type, key in events],
+            pressed,
+        )
+
+    def to_bytes(self) -> bytes:
+        res = [
+            _HEADER.pack(
+                _MAGIC,
+                _VERSION,
+                self.seed,
+                self.n_lanes,
+                self.fixed_dt if self.fixed_dt is not None else 0,
+            )
+        ]
+        for dt, events, pressed in self.ticks:
+            pressed = sorted(pressed)
+            res.append(_TICK.pack(len(events), len(pressed)))
+            if self.fixed_dt is None:
+                res.append(_TICK_DT.pack(dt))
+            for event_type, key in events:
+                res.append(_EVENT.pack(_EVENT_TYPES.index(event_type), key))
+            for key in pressed:
+                res.append(_PRESSED_KEY.pack(key))
+        return b"".join(res)
+
+    @staticmethod
+    def from_bytes(data: bytes) -> "Replay":
+        magic, version, seed, n_lanes, fixed_dt = _HEADER.unpack_from(data, 0)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(
+                "not a replay (or an unsupported version): {}, {}".format(
+                    magic, version
+                )
+            )
+        res = Replay(seed, n_lanes, fixed_dt if fixed_dt > 0 else None)
+        offset = _HEADER.size
+        while offset < len(data):
+            n_events, n_pressed = _TICK.unpack_from(data, offset)
+            offset += _TICK.size
+            if res.fixed_dt is None:
+                (dt,) = _TICK_DT.unpack_from(data, offset)
+                offset += _TICK_DT.size
+            else:
+                dt = res.fixed_dt
+            events = []
+            for _ in range(n_events):
+                type_idx, key = _EVENT.unpack_from(data, offset)
+                events.append((_EVENT_TYPES[type_idx], key))
+                offset += _EVENT.size
+            pressed = []
+            for _ in range(n_pressed):
+                pressed.append(_PRESSED_KEY.unpack_from(data, offset)[0])
+                offset += _PRESSED_KEY.size
+            res.ticks.append((dt, events, PressedKeys(pressed)))
+        return res
+
+    def save(self, path=None):
+        """Saves the replay. If no path is given, it's saved to a new file in the replay directory.
+        :return: the path the replay was saved to, or None if saving failed.
+        """
+        try:
+            if path is None:
+                pathlib.Path(REPLAY_DIR).mkdir(parents=True, exist_ok=True)
+                path = pathlib.Path(REPLAY_DIR) / "replay_{}.trr".format(
+                    time.strftime("%Y%m%d_%H%M%S")
+                )
+            with open(path, "wb") as f:
+                f.write(self.to_bytes())
+            print("INFO: saved replay to: {}".format(path))
+            return path
+        except Exception:
+            print("ERROR: failed to save replay")
+            traceback.print_exc()
+            return None
+
+    @staticmethod
+    def load(path) -> "Replay":
+        with open(path, "rb") as f:
+            return Replay.from_bytes(f.read())
+
+
+def create_replay_mode(loop, replay: Replay):
+    """:return: a GameplayMode in the same starting state as the replay's run."""
+    import gameplay.gamestuff as gamestuff
+    import gameplay.levels as levels
+
+    level = levels.InfiniteGeneratingLevel(replay.n_lanes, seed=replay.seed)
+    return gamestuff.GameplayMode(loop, level=level)
+
+
+def run_replay(loop, replay: Replay, render=False):
+    """Plays a replay back as fast as possible.
+
+    :param render: whether to draw every tick to the loop's screen
+    :return: a summary of the run
+    """
+    mode = create_replay_mode(loop, replay)
+    n_ticks = 0
+    game_time = 0
+    start_time = time.perf_counter()
+    for i in range(len(replay)):
+        dt, events, pressed = replay.get_tick_input(i)
+        mode.update_world(dt, events, pressed)
+        n_ticks += 1
+        game_time += dt
+        if render:
+            mode.draw_to_screen(loop.screen)
+        if mode.player.is_dead():
+            break
+    elapsed = time.perf_counter() - start_time
+
+    return {
+        "ticks": n_ticks,
+        "game_time": game_time,
+        "real_time": elapsed,
+        "speedup": game_time / elapsed if elapsed > 0 else None,
+        "score": mode.player.get_score(),
+        "died": mode.player.is_dead(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Plays back a recorded run.")
+    parser.add_argument("replay", help="path to the replay file")
+    parser.add_argument(
+        "--render", action="store_true", help="draw every tick (to a hidden window)"
+    )
+    parser.add_argument(
+        "--resolution", default="960x540", help="only matters with --render"
+    )
+    args = parser.parse_args(argv)
+
+    # these need to be set before pygame initializes its display and mixer
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    pygame.init()
+    config.Music.enabled = False
+    config.Sound.enabled = False
+    pygame.display.set_mode(tuple(int(v) for v in args.resolution.split("x")))
+
+    import main as game_main
+    import rendering.levelbuilder3d as levelbuilder3d
+    from sound_manager.SoundManager import SoundManager
+
+    SoundManager.init()
+    levelbuilder3d.load_player_art()
+    loop = game_main.GameLoop()
+
+    result = run_replay(loop, Replay.load(args.replay), render=args.render)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""
+Runs the game's simulation (the player, the level and collisions) without a display, sound or rendering.
+
+Runs are seeded and driven by bots, so they can be played in bulk across a process pool to gather statistics
+about a set of GenerationParameters (how far bots get, what kills them) in minutes.
+
+usage (from the repo's root directory):
+    python -m gameplay.simulation --runs 2000 --bot scripted --obstacle-chance 0.3
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import time
+
+import numpy
+import pygame
+
+import config
+import gameplay.levels as levels
+import gameplay.player2d as player2d
+from gameplay.replays import PressedKeys
+
+NO_KEYS_PRESSED = PressedKeys()
+
+
+class Simulation:
+    """Steps a single run forward in fixed-length ticks."""
+
+    # obstacles this far behind the player can't collide with it anymore
+    UNLOAD_DISTANCE = 100
+
+    def __init__(self, seed, n_lanes=9, gen_params=None, dt=1 / 120):
+        """
+        :param gen_params: the level's GenerationParameters, the defaults if None
+        :param dt: the length of a tick, in seconds
+        """
+        self.dt = dt
+        self.level = levels.InfiniteGeneratingLevel(
+            n_lanes, gen_params=gen_params, seed=seed
+        )
+        self.player = player2d.Player()
+        self.ticks = 0
+
+    def get_time(self):
+        """:return: how long the run has lasted, in seconds of game time"""
+        return self.ticks * self.dt
+
+    def step(self, events=(), pressed=NO_KEYS_PRESSED):
+        """Advances the run by one tick.
+
+        :param events: the tick's key events
+        :param pressed: the state of the keyboard, see Player.update
+        """
+        self.player.update(self.dt, self.level, events, pressed)
+        self.level.unload_obstacles(self.player.z - Simulation.UNLOAD_DISTANCE)
+        self.ticks += 1
+
+
+def _key_event(event_type, keys):
+    return pygame.event.Event(event_type, key=keys[0])
+
+
+class ScriptedBot:
+    """A simple, deterministic bot that tries to dodge obstacles. It doesn't need to be good, just consistent."""
+
+    def __init__(self, reaction_time=0.2):
+        self.reaction_time = reaction_time  # seconds
+
+    def get_events(self, player, level):
+        events = []
+        look_ahead = max(5.0, player.speed * self.reaction_time)
+        lane = player.get_lane(level.number_of_lanes())
+        obstacles = [
+            obs
+            for obs in level.get_all_obstacles_between(
+                lane, player.z, player.z + look_ahead
+            )
+            if obs.z + obs.length >= player.z and obs.get_time_dead() < 0
+        ]
+
+        if player.is_sliding() and not any(
+            obs.can_slide_through() for obs in obstacles
+        ):
+            events.append(_key_event(pygame.KEYUP, config.KeyBinds.Game.slide))
+
+        for obs in obstacles:
+            if obs.can_slide_through():
+                if player.is_running():
+                    events.append(
+                        _key_event(pygame.KEYDOWN, config.KeyBinds.Game.slide)
+                    )
+            elif obs.can_jump_over():
+                if player.is_running():
+                    events.append(_key_event(pygame.KEYDOWN, config.KeyBinds.Game.jump))
+            else:
+                events.append(_key_event(pygame.KEYDOWN, config.KeyBinds.Game.right))
+            break
+
+        return events
+
+
+class RandomBot:
+    """Mashes random gameplay keys, as a baseline for how hard a level is without any skill."""
+
+    def __init__(self, seed, presses_per_second=3, dt=1 / 120):
+        self.rng = random.Random(seed)
+        self.press_chance = presses_per_second * dt  # per tick
+        self.key_lists = [
+            config.KeyBinds.Game.jump,
+            config.KeyBinds.Game.slide,
+            config.KeyBinds.Game.left,
+            config.KeyBinds.Game.right,
+        ]
+
+    def get_events(self, player, level):
+        events = []
+        if player.is_sliding() and self.rng.random() < self.press_chance:
+            events.append(_key_event(pygame.KEYUP, config.KeyBinds.Game.slide))
+        if self.rng.random() < self.press_chance:
+            events.append(_key_event(pygame.KEYDOWN, self.rng.choice(self.key_lists)))
+        return events
+
+
+BOTS = {
+    "scripted": lambda seed, dt: ScriptedBot(),
+    "random": lambda seed, dt: RandomBot(seed, dt=dt),
+}
+
+
+def run_simulation(
+    seed, bot="scripted", n_lanes=9, gen_params=None, dt=1 / 120, max_time=300
+):
+    """Plays one run with a bot, until the player dies or max_time runs out.
+
+    :param bot: the name of the bot to play with (see BOTS)
+    :param max_time: in seconds of game time
+    :return: a summary of the run
+    """
+    sim = Simulation(seed, n_lanes=n_lanes, gen_params=gen_params, dt=dt)
+    player_bot = BOTS[bot](seed, dt)
+    max_ticks = int(max_time / dt)
+    while not sim.player.is_dead() and sim.ticks < max_ticks:
+        sim.step(player_bot.get_events(sim.player, sim.level))
+
+    killer = sim.player.get_obstacle_that_killed_me()
+    return {
+        "seed": seed,
+        "died": sim.player.is_dead(),
+        "score": sim.player.get_score(),
+        "time": sim.get_time(),
+        "killed_by": killer.get_type().name if killer is not None else None,
+    }
+
+
+def _run_simulation_from_args(args):
+    return run_simulation(*args)
+
+
+def run_simulations(
+    seeds,
+    bot="scripted",
+    n_lanes=9,
+    gen_params=None,
+    dt=1 / 120,
+    max_time=300,
+    processes=None,
+):
+    """Plays one run per seed, spread across a pool of processes.
+
+    :param processes: how many processes to use, one per CPU if None. If 1, everything runs in this process.
+    :return: the runs' summaries (see run_simulation), in the same order as the seeds
+    """
+    all_args = [(seed, bot, n_lanes, gen_params, dt, max_time) for seed in seeds]
+    if processes == 1:
+        return [_run_simulation_from_args(args) for args in all_args]
+    # not using the pool as a context manager, since that terminates its processes with SIGTERM, which pygame
+    # (initialized on import by util.utility_functions) turns into a QUIT event instead of exiting
+    pool = multiprocessing.Pool(processes)
+    try:
+        return pool.map(
+            _run_simulation_from_args,
+            all_args,
+            chunksize=max(1, len(all_args) // (4 * (processes or os.cpu_count()))),
+        )
+    finally:
+        pool.close()
+        pool.join()
+
+
+def summarize(results):
+    """:return: statistics about a list of run summaries"""
+    scores = numpy.array([r["score"] for r in results])
+    times = numpy.array([r["time"] for r in results])
+    p10, p50, p90 = numpy.percentile(scores, (10, 50, 90)).tolist()
+    killed_by = {}
+    for r in results:
+        if r["killed_by"] is not None:
+            killed_by[r["killed_by"]] = killed_by.get(r["killed_by"], 0) + 1
+    return {
+        "runs": len(results),
+        "deaths": sum(r["died"] for r in results),
+        "score": {
+            "mean": float(scores.mean()),
+            "p10": p10,
+            "p50": p50,
+            "p90": p90,
+            "max": int(scores.max()),
+        },
+        "mean_time": float(times.mean()),
+        "killed_by": killed_by,
+    }
+
+
+def _parse_speeds(text):
+    """:return: GenerationParameters.speeds from text like '0:60,3000:90,10000:120'"""
+    return [tuple(float(v) for v in pair.split(":")) for pair in text.split(",")]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Plays seeded runs with a bot.")
+    parser.add_argument("--runs", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0, help="of the first run")
+    parser.add_argument("--bot", choices=sorted(BOTS), default="scripted")
+    parser.add_argument("--lanes", type=int, default=9)
+    parser.add_argument("--dt", type=float, default=1 / 120, help="seconds per tick")
+    parser.add_argument(
+        "--max-time", type=float, default=300, help="seconds of game time per run"
+    )
+    parser.add_argument("--processes", type=int, help="one per CPU by default")
+    parser.add_argument("--speeds", help="e.g. 0:60,3000:90,10000:120")
+    parser.add_argument("--obstacle-chance", type=float)
+    parser.add_argument("--output", help="file to write every run's summary to")
+    args = parser.parse_args(argv)
+
+    gen_params = levels.GenerationParameters()
+    if args.speeds:
+        gen_params.speeds = _parse_speeds(args.speeds)
+    if args.obstacle_chance is not None:
+        gen_params.obstacle_chance = args.obstacle_chance
+
+    start_time = time.perf_counter()
+    results = run_simulations(
+        range(args.seed, args.seed + args.runs),
+        bot=args.bot,
+        n_lanes=args.lanes,
+        gen_params=gen_params,
+        dt=args.dt,
+        max_time=args.max_time,
+        processes=args.processes,
+    )
+    elapsed = time.perf_counter() - start_time
+
+    summary = summarize(results)
+    summary["real_time"] = elapsed
+    print(json.dumps(summary, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f)
+        print("INFO: saved run summaries to: {}".format(args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -16,11 +16,18 @@ __version__ = "1.0.0"
 
 class GameLoop:
     TARGET_FPS = -1 if config.Debug.fps_test else config.Display.fps
+    MAX_STEPS_PER_FRAME = 8  # fixed timestep modes drop time rather than falling further and further behind
 
     def __init__(self):
         self.running = True
         self.clock = pygame.time.Clock()
         self.screen = pygame.display.get_surface()
+        self._accumulated_time = (
+            0  # time the current fixed timestep mode hasn't simulated yet
+        )
+        self._pending_events = (
+            []
+        )  # events that arrived during frames with no fixed timestep update
         self.current_mode = MainMenuMode(self)
         self.current_mode.on_mode_start()
 
@@ -29,6 +36,33 @@ class GameLoop:
             self.current_mode.on_mode_end()
         self.current_mode = next_mode
         self.current_mode.on_mode_start()
+        self._accumulated_time = 0
+
+    def update_current_mode(self, dt, events):
+        """Updates the current mode. Normally that's one update with the frame's dt, but modes with a fixed timestep
+        get as many updates of that length as fit in the time that has passed (possibly none), and their
+        render_alpha is set to how far the frame is between their last two updates."""
+        mode = self.current_mode
+        events = self._pending_events + events
+        self._pending_events = []
+
+        step = mode.get_fixed_timestep()
+        if step is None:
+            mode.update(dt, events)
+            return
+
+        self._accumulated_time = min(
+            self._accumulated_time + dt, step * self.MAX_STEPS_PER_FRAME
+        )
+        if self._accumulated_time < step:
+            self._pending_events = events  # they'll go to the next update
+        while self._accumulated_time >= step:
+            mode.update(step, events)
+            events = []
+            self._accumulated_time -= step
+            if self.current_mode is not mode:
+                return  # the update changed the mode
+        mode.render_alpha = self._accumulated_time / step
 
     def start(self):
         dt = 0
@@ -58,6 +92,11 @@ class GameLoop:
                             -1 if config.Debug.fps_test else config.Display.fps
                         )
 
+                    if e.key in config.KeyBinds.Toogle.frame_timer:
+                        profiling.get_frame_timer().toggle()
+                    if e.key in config.KeyBinds.Toogle.export_frame_times:
+                        profiling.get_frame_timer().export_csv()
+
                     if e.key in config.KeyBinds.Toogle.flag:
                         config.Debug.flag = not config.Debug.flag
                         pygame.display.set_caption(
@@ -66,22 +105,33 @@ class GameLoop:
                         )
 
             cur_mode = self.current_mode
+            timer = profiling.get_frame_timer()
 
-            cur_mode.update(dt, events)
-            cur_mode.draw_to_screen(self.screen)
+            with timer.stage("frame"):
+                with timer.stage("update"):
+                    self.update_current_mode(dt, events)
+                with timer.stage("draw"):
+                    cur_mode.draw_to_screen(self.screen)
 
-            pygame.display.flip()
+                timer.draw_overlay(self.screen, budget_ms=1000 / config.Display.fps)
+
+                with timer.stage("flip"):
+                    pygame.display.flip()
 
             if config.Debug.fps_test:
                 print(int(self.clock.get_fps()))
 
             dt = self.clock.tick(self.TARGET_FPS) / 1000.0
+            timer.end_frame()
 
 
 class GameMode:
     def __init__(self, loop: GameLoop):
         self.loop: GameLoop = loop
 
+        # for modes with a fixed timestep: how far the current frame is between the last two updates (from 0 to 1)
+        self.render_alpha = 1.0
+
     def on_mode_start(self):
         """Called when mode becomes active"""
         pass
@@ -90,6 +140,11 @@ class GameMode:
         """Called when mode becomes inactive"""
         pass
 
+    def get_fixed_timestep(self):
+        """If this returns a number of seconds, update is only ever called with that dt (see
+        GameLoop.update_current_mode). If it returns None, update is called once per frame."""
+        return None
+
     def update(self, dt, events):
         pass
 
@@ -114,27 +169,26 @@ class MainMenuMode(GameMode):
         ]
         self.title_font = fonts.get_font(config.FontSize.title)
         self.option_font = fonts.get_font(config.FontSize.option)
-        self.options_rects = []
 
-        # get options' text positions
+        # get the title's and options' text positions
+        self.layout = fonts.MenuLayout(config.Display.width)
         title_size = self.title_font.size("TEMPEST RUN")
         title_y = config.Display.height // 3 - title_size[1] // 2
+        self.layout.add_line(self.title_font, "TEMPEST RUN", title_y, neon.WHITE)
         option_y = max(config.Display.height // 2, title_y + title_size[1])
-        for i in range(len(self.options)):
-            option_size = self.option_font.size(self.options[i][0].upper())
-            option_y += option_size[1]
-            self.options_rects.append(
-                pygame.Rect(
-                    config.Display.width // 2 - option_size[0] // 2,
-                    option_y - option_size[1],
-                    option_size[0],
-                    option_size[1],
-                )
+        self.option_lines = []
+        for option_text, _ in self.options:
+            line = self.layout.add_line(
+                self.option_font, option_text.upper(), option_y, neon.WHITE
             )
+            self.option_lines.append(line)
+            option_y = self.layout.get_rect(line).bottom
+        self.options_rects = [self.layout.get_rect(line) for line in self.option_lines]
 
         self.bg_level = levels.InfiniteGeneratingLevel(10)
         self.bg_camera = threedee.Camera3D()
         self.bg_renderer = neon.NeonRenderer()
+        self._bg_lines = threedee.LineBatch3D()  # reused every frame
 
     def on_mode_start(self):
         SoundManager.play_song("menu_theme", fadein_ms=0)
@@ -204,28 +258,10 @@ class MainMenuMode(GameMode):
 
         self._draw_bg(screen)
 
-        screen_size = screen.get_size()
-        title_surface = self.title_font.render("TEMPEST RUN", True, neon.WHITE)
-
-        title_size = title_surface.get_size()
-        title_y = screen_size[1] // 3 - title_size[1] // 2
-        screen.blit(
-            title_surface, dest=(screen_size[0] // 2 - title_size[0] // 2, title_y)
-        )
-
-        option_y = max(screen_size[1] // 2, title_y + title_size[1])
-        for i in range(len(self.options)):
-            option_text = self.options[i][0]
+        for i, line in enumerate(self.option_lines):
             is_selected = i == self.selected_option_idx
-            color = neon.WHITE if not is_selected else neon.RED
-
-            option_surface = self.option_font.render(option_text.upper(), True, color)
-            option_size = option_surface.get_size()
-            screen.blit(
-                option_surface,
-                (screen_size[0] // 2 - option_size[0] // 2, option_y),
-            )
-            option_y += option_size[1]
+            self.layout.set_color(line, neon.WHITE if not is_selected else neon.RED)
+        self.layout.draw(screen)
 
     def _update_bg(self, dt):
         rot_speed = 10  # degrees per sec
@@ -240,20 +276,21 @@ class MainMenuMode(GameMode):
         cur_z = self.bg_camera.position.z
         cell_len = 20
 
-        all_3d_lines = []
-        for i in range(-1, 20):
-            all_3d_lines.extend(
-                levelbuilder3d.build_section(
-                    (i + cur_z // cell_len) * cell_len, cell_len, self.bg_level
-                )
-            )
+        all_3d_lines = self._bg_lines
+        all_3d_lines.clear()
+        first_cell_z = (cur_z // cell_len - 1) * cell_len
+        levelbuilder3d.build_tunnel(
+            first_cell_z,
+            first_cell_z + 20 * cell_len,
+            cell_len,
+            self.bg_level,
+            out=all_3d_lines,
+        )
 
-        lines_to_draw = self.bg_camera.project_to_surface(
+        lines_to_draw = self.bg_camera.project_batch_to_surface(
             screen, all_3d_lines, depth_shading=(0, 100)
         )
-        self.bg_renderer.draw_lines(
-            screen, neon.NeonLine.convert_line2ds_to_neon_lines(lines_to_draw)
-        )
+        self.bg_renderer.draw_lines(screen, lines_to_draw)
 
 
 def create_or_recreate_window():
@@ -134,6 +134,12 @@ def do_it():
             print("INFO: user opted to not overwrite pre-existing build, exiting")
             return
 
+    # imported here, since it initializes pygame
+    import compile_assets
+
+    print("INFO: compiling assets")
+    compile_assets.do_it()
+
     dist_dir_subdir = pathlib.Path("{}/TempestRun".format(dist_dir))
 
     with tempfile.TemporaryDirectory() as temp_dir:
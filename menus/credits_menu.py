@@ -107,7 +107,7 @@ class CreditsMenuMode(GameMode):
                 screen, (0, 255, 0), True, self.get_square_points(i[0], i[1], i[2])
             )
         screen_size = screen.get_size()
-        title_surface = self.title_font.render("CREDITS", False, neon.WHITE)
+        title_surface = fonts.render_text(self.title_font, "CREDITS", False, neon.WHITE)
 
         title_size = title_surface.get_size()
         title_y = screen_size[1] // 4 - title_size[1] // 2
@@ -130,7 +130,9 @@ class CreditsMenuMode(GameMode):
                     msg = "programming"
                 elif i == 3:
                     msg = "sfx & bgm"
-            option_surface = self.option_font.render(option_text.upper(), False, color)
+            option_surface = fonts.render_text(
+                self.option_font, option_text.upper(), False, color
+            )
             option_size = option_surface.get_size()
             option_x = (
                 screen_size[0] // 6
@@ -138,7 +140,7 @@ class CreditsMenuMode(GameMode):
                 - option_size[0] // 2
             )
             screen.blit(option_surface, dest=(option_x, option_y))
-            msg_surf = self.info_font.render(msg.upper(), False, neon.WHITE)
+            msg_surf = fonts.render_text(self.info_font, msg.upper(), False, neon.WHITE)
             screen.blit(
                 msg_surf,
                 msg_surf.get_rect(center=(screen_size[0] // 2, screen_size[1] * 3 / 4)),
@@ -123,7 +123,7 @@ class HelpMenuMode(GameMode):
                 screen, (0, 255, 0), True, self.get_square_points(i[0], i[1], i[2])
             )
         screen_size = screen.get_size()
-        title_surface = self.title_font.render("HELP", False, neon.WHITE)
+        title_surface = fonts.render_text(self.title_font, "HELP", False, neon.WHITE)
 
         title_size = title_surface.get_size()
         title_y = screen_size[1] // 4 - title_size[1] // 2
@@ -157,7 +157,9 @@ class HelpMenuMode(GameMode):
                 elif i == 2:
                     msgs = ["press ESCAPE to go back"]
 
-            option_surface = self.option_font.render(option_text.upper(), True, color)
+            option_surface = fonts.render_text(
+                self.option_font, option_text.upper(), True, color
+            )
             option_size = option_surface.get_size()
             screen.blit(
                 option_surface,
@@ -168,7 +170,7 @@ class HelpMenuMode(GameMode):
                 ),
             )
             for index, msg in enumerate(msgs):
-                msg_surf = self.info_font.render(msg, True, neon.WHITE)
+                msg_surf = fonts.render_text(self.info_font, msg, True, neon.WHITE)
                 screen.blit(
                     msg_surf,
                     msg_surf.get_rect(
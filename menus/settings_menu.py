@@ -207,7 +207,7 @@ class SettingsMenuMode(main.GameMode):
     def draw_to_screen(self, screen: pygame.Surface):
         screen.fill((0, 0, 0))
         screen_size = screen.get_size()
-        title_surface = self.title_font.render("SETTINGS", True, neon.WHITE)
+        title_surface = fonts.render_text(self.title_font, "SETTINGS", True, neon.WHITE)
 
         title_size = title_surface.get_size()
         title_y = screen_size[1] // 3 - title_size[1] // 2
@@ -228,7 +228,7 @@ class SettingsMenuMode(main.GameMode):
                     text = text + "  >"
             else:
                 text = option_text.upper()
-            option_surface = self.option_font.render(text, True, color)
+            option_surface = fonts.render_text(self.option_font, text, True, color)
             option_size = option_surface.get_size()
             screen.blit(
                 option_surface,
@@ -1,49 +1,141 @@
-from typing import List
+from typing import List, Optional, Union
 from pygame import Vector3, Vector2
+import math
 import os
 import traceback
 import json
+import hashlib
+import numpy
 import config
 import rendering.threedee as threedee
 import rendering.neon as neon
 import util.utility_functions as utility_functions
 
 
-def get_ring_points(z, level, rotation=None) -> List[Vector3]:
-    n = level.number_of_lanes()
-    radius = level.get_radius(z)
+_CACHED_UNIT_RINGS = {}  # number of lanes -> numpy array of shape (n, 2)
+
+
+def get_unit_ring(n) -> numpy.ndarray:
+    """:return: the (x, y) points of an unrotated ring of radius 1 with n lanes, as an (n, 2) array."""
+    if n not in _CACHED_UNIT_RINGS:
+        angles = numpy.radians(numpy.arange(n) * 360 / n)
+        ring = numpy.stack([numpy.cos(angles), numpy.sin(angles)], axis=1)
+        ring.flags.writeable = False
+        _CACHED_UNIT_RINGS[n] = ring
+    return _CACHED_UNIT_RINGS[n]
+
+
+def get_rings(zs, level, rotation=None) -> numpy.ndarray:
+    """Builds the ring points at many z coordinates at once.
+
+    :param zs: the z coordinates of the rings
+    :param rotation: if given, overrides the level's rotation for all the rings
+    :return: a float32 array of shape (len(zs), n_lanes, 3)
+    """
+    zs = numpy.asarray(zs, dtype=numpy.float64).reshape(-1)
+    radii = numpy.array([level.get_radius(z) for z in zs])
     if rotation is None:
-        rotation = level.get_rotation(z)
-    res = []
-    for i in range(n):
-        p = Vector3(radius, 0, z)
-        p.rotate_ip(i * 360 / n + rotation, Vector3(0, 0, 1))
-        res.append(p)
+        rotations = numpy.array([level.get_rotation(z) for z in zs])
+    else:
+        rotations = numpy.full(zs.shape, rotation, dtype=numpy.float64)
+
+    unit_ring = get_unit_ring(level.number_of_lanes())
+    rads = numpy.radians(rotations)
+    cos = numpy.cos(rads)[:, None]
+    sin = numpy.sin(rads)[:, None]
+
+    res = numpy.empty((len(zs), unit_ring.shape[0], 3), dtype=numpy.float32)
+    res[:, :, 0] = (unit_ring[:, 0] * cos - unit_ring[:, 1] * sin) * radii[:, None]
+    res[:, :, 1] = (unit_ring[:, 0] * sin + unit_ring[:, 1] * cos) * radii[:, None]
+    res[:, :, 2] = zs[:, None]
     return res
 
 
-def build_section(z, length, level) -> List[threedee.Line3D]:
-    ground_lines = []
-    near_ring = get_ring_points(z, level)
-    far_ring = get_ring_points(z + length, level)
+def get_ring_points(z, level, rotation=None) -> List[Vector3]:
+    return [Vector3(p) for p in get_rings([z], level, rotation)[0].tolist()]
 
-    for i in range(level.number_of_lanes()):
-        ground_lines.append(
-            threedee.Line3D(near_ring[i], far_ring[i], color=level.get_color(z))
-        )
-        ground_lines.append(
-            threedee.Line3D(far_ring[i], far_ring[i - 1], color=level.get_color(z))
-        )
 
-    return ground_lines
+def build_section(
+    z, length, level, out: Optional[threedee.LineBatch3D] = None
+) -> threedee.LineBatch3D:
+    """Builds one cell of the level's tunnel. If out is given, the lines are appended to it."""
+    if out is None:
+        out = threedee.LineBatch3D()
+    near_ring, far_ring = get_rings([z, z + length], level)
+
+    # for each lane: a line along the lane's edge, then a line across the far end of the lane
+    p1s = numpy.stack([near_ring, far_ring], axis=1).reshape(-1, 3)
+    p2s = numpy.stack([far_ring, numpy.roll(far_ring, 1, axis=0)], axis=1).reshape(
+        -1, 3
+    )
+    out.add_lines(p1s, p2s, color=level.get_color(z))
+
+    return out
+
+
+_CACHED_TUNNEL_TOPOLOGIES = (
+    {}
+)  # (number of lanes, number of cells) -> (p1 indices, p2 indices)
+
+
+def _get_tunnel_topology(n_lanes, n_cells):
+    """
+    :return: the indices of the tunnel's lines' endpoints, into a flattened (n_cells + 1, n_lanes) grid of ring points.
+             For each cell and lane there's a line along the lane's edge, then a line across the far end of the lane
+             (the same order build_section uses).
+    """
+    key = (n_lanes, n_cells)
+    if key not in _CACHED_TUNNEL_TOPOLOGIES:
+        cells = numpy.arange(n_cells)[:, None]
+        lanes = numpy.arange(n_lanes)[None, :]
+        near = cells * n_lanes + lanes
+        far = near + n_lanes
+        far_prev = (cells + 1) * n_lanes + (lanes - 1) % n_lanes
+        p1_idxs = numpy.stack([near, far], axis=2).reshape(-1)
+        p2_idxs = numpy.stack([far, far_prev], axis=2).reshape(-1)
+        _CACHED_TUNNEL_TOPOLOGIES[key] = (p1_idxs, p2_idxs)
+    return _CACHED_TUNNEL_TOPOLOGIES[key]
+
+
+def build_tunnel(
+    z_start, z_end, cell_length, level, out: Optional[threedee.LineBatch3D] = None
+) -> threedee.LineBatch3D:
+    """Builds every cell of the level's tunnel between the two z coordinates in one go. The result looks the same as
+    calling build_section for each of those cells. If out is given, the lines are appended to it.
+
+    Each cell gets the level's color at its near ring, so the tunnel's color follows the level's gradient.
+    """
+    if out is None:
+        out = threedee.LineBatch3D()
+    first_cell = math.floor(z_start / cell_length)
+    n_cells = math.floor(z_end / cell_length) + 1 - first_cell
+    if n_cells <= 0:
+        return out
+
+    ring_zs = (first_cell + numpy.arange(n_cells + 1)) * cell_length
+    ring_pts = get_rings(ring_zs, level).reshape((-1, 3))
+    ring_colors = numpy.array(
+        [threedee.rgb(level.get_color(z)) for z in ring_zs[:-1].tolist()],
+        dtype=numpy.uint8,
+    )
+
+    p1_idxs, p2_idxs = _get_tunnel_topology(level.number_of_lanes(), n_cells)
+    out.add_lines(
+        ring_pts[p1_idxs],
+        ring_pts[p2_idxs],
+        color=numpy.repeat(ring_colors, 2 * level.number_of_lanes(), axis=0),
+    )
+    return out
 
 
 def get_rotation_to_make_lane_at_bottom(z, lane, level):
-    unrotated_ring_pts = get_ring_points(z, level, rotation=0)
-    pt_left = unrotated_ring_pts[(lane - 1) % level.number_of_lanes()]
-    pt_right = unrotated_ring_pts[lane % level.number_of_lanes()]
+    unit_ring = get_unit_ring(level.number_of_lanes())
+    pt_left = unit_ring[(lane - 1) % level.number_of_lanes()]
+    pt_right = unit_ring[lane % level.number_of_lanes()]
     pt_center = (pt_left + pt_right) / 2
-    res = Vector2(0, -1).as_polar()[1] - Vector2(pt_center.x, pt_center.y).as_polar()[1]
+    res = (
+        Vector2(0, -1).as_polar()[1] - Vector2(pt_center[0], pt_center[1]).as_polar()[1]
+    )
     if res < 0:
         res += 360
     return res
@@ -55,22 +147,29 @@ EXPLOSION_ROT_SPEED = 20
 EXPLOSION_SRC_POINT = Vector3(0, 0, 0)
 
 
-def build_obstacle(obs, level, player) -> List[threedee.Line3D]:
+def _get_animated_model(
+    obs, level, player
+) -> Optional[Union[List[threedee.Line3D], threedee.LineBatch3D]]:
+    """:return: the obstacle's model (a List[Line3D], or a LineBatch3D while it's exploding), animated if it needs
+    to be, or None if the obstacle is gone."""
     model = obs.get_model()
 
     if not config.Debug.jumping_enemies:
         # This makes enemies explode when you slide through them.
         time_dead = obs.get_time_dead()
         if time_dead > 1:
-            return []  # it's gone
+            return None  # it's gone
         elif time_dead <= 0:
             pass
         elif time_dead > 0:
-            model = blow_up(
-                model,
-                EXPLOSION_SRC_POINT,
-                EXPLOSION_DIST * (time_dead / EXPLOSION_DURATION),
-                rotation_speed=EXPLOSION_ROT_SPEED,
+            explosion = obs.get_cached_explosion()
+            if explosion is None:
+                explosion = Explosion(
+                    model, EXPLOSION_SRC_POINT, rotation_speed=EXPLOSION_ROT_SPEED
+                )
+                obs.set_cached_explosion(explosion)
+            model = explosion.get_lines(
+                EXPLOSION_DIST * (time_dead / EXPLOSION_DURATION)
             )
     else:
         # this makes enemies jump when the player approaches, so the player slides underneath them
@@ -84,42 +183,228 @@ def build_obstacle(obs, level, player) -> List[threedee.Line3D]:
             z_dist = abs(obs.z - player.z)
             if z_dist < z_range:
                 model = [l.shift(dy=0.4 * (1 - z_dist / z_range)) for l in model]
-    return align_shape_to_level_surface(
-        model, obs.z, obs.z + obs.length, obs.lane, level, obs.should_squeeze()
+    return model
+
+
+def rotate_on_z_axis(points: numpy.ndarray, degrees):
+    """Rotates an (n, 3) array of points around the z-axis, in place.
+
+    :param degrees: the rotation, either a single value or one per point
+    """
+    rads = numpy.radians(numpy.asarray(degrees, dtype=numpy.float64))
+    cos = numpy.cos(rads)
+    sin = numpy.sin(rads)
+    xs = points[:, 0].astype(numpy.float64)
+    ys = points[:, 1].astype(numpy.float64)
+    points[:, 0] = xs * cos - ys * sin
+    points[:, 1] = xs * sin + ys * cos
+
+
+def _align_obstacles(obstacles, models, level) -> List[threedee.LineBatch3D]:
+    """Aligns each obstacle's model (a List[Line3D] or a LineBatch3D) to the level's surface, without the level's
+    rotation, all in one batch.
+
+    :return: the aligned lines of each obstacle
+    """
+    if len(obstacles) == 0:
+        return []
+    to_align = threedee.LineBatch3D()  # model-space lines of all the obstacles
+    counts = []
+    for model in models:
+        counts.append(len(model))
+        if isinstance(model, threedee.LineBatch3D):
+            to_align.extend(model)
+        else:
+            to_align.add_line3ds(model)
+
+    aligned_pts = align_shapes_to_level_surface(
+        to_align.points,
+        numpy.repeat(numpy.arange(len(obstacles)), numpy.array(counts) * 2),
+        [obs.z for obs in obstacles],
+        [obs.z + obs.length for obs in obstacles],
+        [obs.lane for obs in obstacles],
+        [obs.should_squeeze() for obs in obstacles],
+        level,
+        rotation=0,
     )
+    res = []
+    start = 0
+    for count in counts:
+        end = start + count
+        lines = threedee.LineBatch3D(capacity=count)
+        lines.add_lines(
+            aligned_pts[start * 2 : end * 2 : 2],
+            aligned_pts[start * 2 + 1 : end * 2 : 2],
+            color=to_align.colors[start:end],
+            width=to_align.widths[start:end],
+        )
+        res.append(lines)
+        start = end
+    return res
+
+
+def prebuild_obstacles(obstacles, level):
+    """Aligns the obstacles' (unanimated) models to the level's surface and caches the results on them, so that
+    build_obstacles doesn't have to the first time they're drawn. Safe to call from another thread, as long as
+    nothing else is using the obstacles yet."""
+    obstacles = [obs for obs in obstacles if obs.get_cached_aligned_lines() is None]
+    models = [obs.get_model() for obs in obstacles]
+    for obs, lines in zip(obstacles, _align_obstacles(obstacles, models, level)):
+        obs.set_cached_aligned_lines(lines)
+
+
+def build_obstacle(
+    obs, level, player, out: Optional[threedee.LineBatch3D] = None
+) -> threedee.LineBatch3D:
+    """Builds an obstacle's lines in world space. If out is given, the lines are appended to it."""
+    return build_obstacles([obs], level, player, out=out)
+
+
+def build_obstacles(
+    obstacles, level, player, out: Optional[threedee.LineBatch3D] = None
+) -> threedee.LineBatch3D:
+    """Builds many obstacles' lines in world space, in order. If out is given, the lines are appended to it.
+
+    An obstacle that isn't animating is only aligned to the level's surface once, without the level's rotation,
+    and the result is cached on the obstacle. The level's rotation is then applied to every obstacle's lines
+    in a single pass (this assumes the level's rotation doesn't change along any single obstacle).
+    """
+    if out is None:
+        out = threedee.LineBatch3D()
+
+    # for each obstacle: (obstacle, its aligned lines or the index of its lines in aligned)
+    entries = []
+    to_align_obstacles = []
+    to_align_models = []
+    to_align_is_static = []  # whether the aligned lines can be cached
+
+    for obs in obstacles:
+        model = _get_animated_model(obs, level, player)
+        if model is None:
+            continue
+        is_static = model is obs.get_model()
+        if is_static and obs.get_cached_aligned_lines() is not None:
+            entries.append((obs, obs.get_cached_aligned_lines()))
+        else:
+            entries.append((obs, len(to_align_obstacles)))
+            to_align_obstacles.append(obs)
+            to_align_models.append(model)
+            to_align_is_static.append(is_static)
+
+    aligned = _align_obstacles(to_align_obstacles, to_align_models, level)
+    for obs, lines, is_static in zip(to_align_obstacles, aligned, to_align_is_static):
+        if is_static:
+            obs.set_cached_aligned_lines(lines)
+
+    start = len(out)
+    line_counts = []
+    rotations = []
+    for obs, lines in entries:
+        if not isinstance(lines, threedee.LineBatch3D):
+            lines = aligned[lines]
+        out.extend(lines)
+        line_counts.append(len(lines))
+        rotations.append(level.get_rotation(obs.z))
+
+    if len(out) > start:
+        if all(rot == rotations[0] for rot in rotations):
+            rotate_on_z_axis(out.points[start * 2 :], rotations[0])
+        else:
+            rotate_on_z_axis(
+                out.points[start * 2 :],
+                numpy.repeat(rotations, numpy.array(line_counts) * 2),
+            )
+    return out
+
+
+class Explosion:
+    """A shape being blown up (see blow_up), with all the per-line parameters that don't depend on time
+    precomputed. Each line moves away from from_pt and spins around its own center."""
+
+    def __init__(
+        self,
+        lines: Union[List[threedee.Line3D], threedee.LineBatch3D],
+        from_pt: Vector3,
+        rotation_speed=30,
+        axis=(0, 1),
+    ):
+        if not isinstance(lines, threedee.LineBatch3D):
+            lines = threedee.LineBatch3D.from_line3ds(lines)
+        pts = lines.points.astype(numpy.float64).reshape((-1, 2, 3))
+        self.centers = pts.mean(axis=1)
+        self.offsets = (
+            pts - self.centers[:, None]
+        )  # from each line's center to its ends
+        self.colors = lines.colors.copy()
+        self.widths = lines.widths.copy()
+
+        directions = self.centers - numpy.array(from_pt, dtype=numpy.float64)
+        lengths = numpy.linalg.norm(directions, axis=1)
+        self.is_moving = lengths >= 0.001  # lines on top of from_pt stay put
+        self.directions = directions / numpy.where(self.is_moving, lengths, 1)[:, None]
+        self.directions[:, [i for i in range(3) if i not in axis]] = 0
+        self.rotation_speeds = numpy.where(
+            directions[:, 0] < 0, -rotation_speed, rotation_speed
+        )
+
+    def __len__(self):
+        return self.centers.shape[0]
+
+    def get_lines(
+        self, amount, out: Optional[threedee.LineBatch3D] = None
+    ) -> threedee.LineBatch3D:
+        """:return: the exploded lines, after moving amount units. If out is given, the lines are appended to it."""
+        if out is None:
+            out = threedee.LineBatch3D(capacity=len(self))
+        rads = numpy.radians(self.rotation_speeds * amount)
+        rads[~self.is_moving] = 0
+        cos = numpy.cos(rads)[:, None]
+        sin = numpy.sin(rads)[:, None]
+        centers = self.centers + self.directions * (
+            numpy.where(self.is_moving, amount, 0)[:, None]
+        )
+
+        pts = numpy.empty_like(self.offsets)
+        pts[:, :, 0] = self.offsets[:, :, 0] * cos - self.offsets[:, :, 1] * sin
+        pts[:, :, 1] = self.offsets[:, :, 0] * sin + self.offsets[:, :, 1] * cos
+        pts[:, :, 2] = self.offsets[:, :, 2]
+        pts += centers[:, None]
+
+        out.add_lines(pts[:, 0], pts[:, 1], color=self.colors, width=self.widths)
+        return out
 
 
 def blow_up(
-    lines: List[threedee.Line3D],
+    lines: Union[List[threedee.Line3D], threedee.LineBatch3D],
     from_pt: Vector3,
     amount,
     rotation_speed=30,
     axis=(0, 1),
-) -> List[threedee.Line3D]:
-    res = []
-    for l in lines:
-        c = l.center()
-        direction = c - from_pt
-        if direction.length() < 0.001 or amount == 0:
-            res.append(l)
-        else:
-            direction.scale_to_length(amount)
-            dx = direction.x if 0 in axis else 0
-            dy = direction.y if 1 in axis else 0
-            dz = direction.z if 2 in axis else 0
-            rot = rotation_speed * amount
-            if direction.x < 0:
-                rot = -rot
-            res.append(l.rotate_on_z_axis(rot).shift(dx, dy, dz))
-    return res
+) -> threedee.LineBatch3D:
+    return Explosion(
+        lines, from_pt, rotation_speed=rotation_speed, axis=axis
+    ).get_lines(amount)
 
 
 def build_rect(
-    z_start, length, level, lane_n, hover_height, color, width, with_x=False
-) -> List[threedee.Line3D]:
-    """Builds a 3D rectangle lying flat against the surface of the level."""
-    near_ring = get_ring_points(z_start, level)
-    far_ring = get_ring_points(z_start + length, level)
+    z_start,
+    length,
+    level,
+    lane_n,
+    hover_height,
+    color,
+    width,
+    with_x=False,
+    out: Optional[threedee.LineBatch3D] = None,
+) -> threedee.LineBatch3D:
+    """Builds a 3D rectangle lying flat against the surface of the level. If out is given, the lines are appended
+    to it."""
+    if out is None:
+        out = threedee.LineBatch3D()
+    near_ring, far_ring = [
+        [Vector3(p) for p in ring]
+        for ring in get_rings([z_start, z_start + length], level).tolist()
+    ]
     corners = [
         near_ring[lane_n % level.number_of_lanes()],
         near_ring[(lane_n - 1) % level.number_of_lanes()],
@@ -134,127 +419,290 @@ def build_rect(
         hover_offset.scale_to_length(hover_height)
         inset_corners.append(c + hover_offset)
 
-    res = [
-        threedee.Line3D(inset_corners[0], inset_corners[1], color=color, width=width),
-        threedee.Line3D(inset_corners[1], inset_corners[2], color=color, width=width),
-        threedee.Line3D(inset_corners[2], inset_corners[3], color=color, width=width),
-        threedee.Line3D(inset_corners[3], inset_corners[0], color=color, width=width),
-    ]
+    out.add_line(inset_corners[0], inset_corners[1], color=color, width=width)
+    out.add_line(inset_corners[1], inset_corners[2], color=color, width=width)
+    out.add_line(inset_corners[2], inset_corners[3], color=color, width=width)
+    out.add_line(inset_corners[3], inset_corners[0], color=color, width=width)
 
     if with_x:
-        res.append(
-            threedee.Line3D(
-                inset_corners[0], inset_corners[2], color=color, width=width
-            )
-        )
-        res.append(
-            threedee.Line3D(
-                inset_corners[1], inset_corners[3], color=color, width=width
-            )
-        )
+        out.add_line(inset_corners[0], inset_corners[2], color=color, width=width)
+        out.add_line(inset_corners[1], inset_corners[3], color=color, width=width)
 
-    return res
+    return out
 
 
-_CACHED_PLAYER_ART = {}
+_CACHED_PLAYER_ART = {}  # animation name -> PlayerAnimation
 
+PLAYER_ANIMATIONS = ["jump", "run", "slide"]
+PLAYER_ART_DIR = "assets/wireframe_models/player"
+PLAYER_ART_CACHE_PATH = "assets/wireframe_models/player_art.npy"
+PLAYER_ART_CACHE_INDEX_PATH = "assets/wireframe_models/player_art_index.json"
 
-def load_player_art(w=0.8, h=0.5):
-    min_x = float(1000)
-    max_x = float(-1000)
-    min_y = float(1000)
-    max_y = float(-1000)
+# how each of the player's animations advances: (what drives it, how long each keyframe lasts, in units or seconds)
+PLAYER_ANIMATION_TIMING = {
+    "jump": ("distance", 20),
+    "run": ("distance", 20),
+    "slide": ("distance", 20),
+}
+PLAYER_ANIMATION_INTERPOLATE = False
+
+
+class PlayerAnimation:
+    """One of the player's animations, with each keyframe stored as an (n_lines, 2, 3) array of line endpoints."""
+
+    def __init__(
+        self,
+        keyframes,
+        flipped_keyframes=None,
+        frame_length=20,
+        driven_by="distance",
+        interpolate=False,
+    ):
+        """
+        :param keyframes: the animation's keyframes, as (n_lines, 2, 3) arrays
+        :param flipped_keyframes: the same keyframes mirrored along the x-axis, or None. If given, each keyframe is
+                                  followed by its mirror image (that's what makes a single frame look like running)
+        :param frame_length: how long each keyframe lasts, in units (if driven by distance) or seconds (if by time)
+        :param driven_by: "distance" to advance the animation as the player moves forward, or "time" to advance it
+                          with the time the player has spent in their current mode
+        :param interpolate: whether to blend between consecutive keyframes (only possible when they have the same
+                            number of lines, otherwise the animation snaps between them). A keyframe is never
+                            blended with its mirror image, the animation flips between those instead.
+        """
+        self.keyframes = keyframes
+        self.flipped_keyframes = flipped_keyframes
+        self.frame_length = frame_length
+        self.driven_by = driven_by
+        self.interpolate = interpolate
+
+    def __len__(self):
+        if self.flipped_keyframes is not None:
+            return 2 * len(self.keyframes)
+        return len(self.keyframes)
+
+    def get_progress(self, player) -> float:
+        """:return: how many keyframes into the animation the player is"""
+        if self.driven_by == "time":
+            return player.mode_time / self.frame_length
+        else:
+            return player.z / self.frame_length
+
+    def get_points(self, progress, dy=0) -> numpy.ndarray:
+        """:return: a new (n_lines, 2, 3) array of the animation's lines at the given progress, shifted up by dy."""
+        if self.flipped_keyframes is None:
+            keyframes = self.keyframes
+            pose = progress
+        else:
+            # the pose advances at half speed while the animation alternates between the keyframes and their mirror
+            # images, so consecutive poses only ever get blended within the same orientation
+            if math.floor(progress) % 2 == 0:
+                keyframes = self.keyframes
+            else:
+                keyframes = self.flipped_keyframes
+            pose = progress / 2
+        frame_n = math.floor(pose)
+        points = keyframes[frame_n % len(keyframes)]
+        if self.interpolate:
+            next_points = keyframes[(frame_n + 1) % len(keyframes)]
+            if next_points.shape == points.shape:
+                points = points + (pose - frame_n) * (next_points - points)
+        return points + (0, dy, 0)
+
+
+def _get_player_art_json_paths(art_dir=PLAYER_ART_DIR):
+    """:return: animation name -> sorted list of paths to the json files of its frames"""
+    res = {}
+    for anim_name in PLAYER_ANIMATIONS:
+        anim_dir = utility_functions.resource_path(
+            os.path.abspath(art_dir + "/" + anim_name)
+        )
+        if os.path.isdir(anim_dir):
+            res[anim_name] = [
+                os.path.join(anim_dir, filename)
+                for filename in sorted(os.listdir(anim_dir))
+                if filename.endswith(".json")
+            ]
+    return res
+
+
+def _hash_player_art_sources(json_paths) -> str:
+    """:return: a fingerprint of the contents of every json file the art is read from. Line endings are
+    normalized, so that it doesn't depend on how git checked the files out."""
+    sha = hashlib.sha1()
+    for anim_name in sorted(json_paths):
+        for path in json_paths[anim_name]:
+            sha.update("{}/{}\n".format(anim_name, os.path.basename(path)).encode())
+            with open(path, "rb") as f:
+                sha.update(f.read().replace(b"\r\n", b"\n"))
+    return sha.hexdigest()
 
-    anims = ["jump", "run", "slide"]
 
-    # first pass just finds the max / mins of the set of animations
-    for anim_name in anims:
+def _read_player_art_from_json(json_paths, w, h):
+    """Reads and normalizes the player's art, so that all of it fits in a w x h box (centered horizontally, with
+    the feet at y = 0, and z = 0).
+
+    :return: animation name -> (points, flipped_points, frame_offsets), where points is an (n_lines, 2, 3) array of
+             the endpoints of every frame's lines, flipped_points is the same thing mirrored along the x-axis, and
+             frame i's lines are points[frame_offsets[i]:frame_offsets[i + 1]].
+    """
+    raw_art = {}
+    for anim_name, paths in json_paths.items():
         try:
-            raw_path = os.path.abspath("assets/wireframe_models/player/" + anim_name)
-            safe_path = utility_functions.resource_path(raw_path)
-
-            for filename in sorted(os.listdir(safe_path)):
-                if filename.endswith(".json"):
-                    with open(
-                        utility_functions.resource_path(raw_path + "/" + filename)
-                    ) as f:
-                        for line in json.load(f):
-                            for pt in line:
-                                x = float(pt[0])
-                                y = float(pt[1])
-                                min_x = min(min_x, x)
-                                max_x = max(max_x, x)
-                                min_y = min(min_y, y)
-                                max_y = max(max_y, y)
+            frames = []
+            for path in paths:
+                with open(path) as f:
+                    frames.append(
+                        numpy.array(json.load(f), dtype=numpy.float64).reshape(
+                            (-1, 2, 2)
+                        )
+                    )
+            raw_art[anim_name] = frames
         except Exception:
             print("ERROR: failed to load player art of type: {}".format(anim_name))
             traceback.print_exc()
 
-    # 2nd pass builds the actual lines
-    # yes we're loading the files a 2nd time but it's 4am i don't care
-    for anim_name in anims:
-        frames = []
-        try:
-            raw_path = os.path.abspath("assets/wireframe_models/player/" + anim_name)
-            safe_path = utility_functions.resource_path(raw_path)
-
-            for filename in sorted(os.listdir(safe_path)):
-                lines_for_frame = []
-                lines_for_frame_xflip = []
-                if filename.endswith(".json"):
-                    with open(
-                        utility_functions.resource_path(raw_path + "/" + filename)
-                    ) as f:
-                        for line in json.load(f):
-                            norm_pts = []
-                            norm_pts_xflip = []
-                            for pt in line:
-                                x = float(pt[0])
-                                y = float(pt[1])
-                                norm_pts.append(
-                                    (
-                                        utility_functions.map_from_interval_to_interval(
-                                            x, [min_x, max_x], [-w / 2, w / 2]
-                                        ),
-                                        utility_functions.map_from_interval_to_interval(
-                                            y, [max_y, min_y], [0, h]
-                                        ),
-                                    )
-                                )
-                                norm_pts_xflip.append(
-                                    (
-                                        utility_functions.map_from_interval_to_interval(
-                                            x, [min_x, max_x], [w / 2, -w / 2]
-                                        ),
-                                        utility_functions.map_from_interval_to_interval(
-                                            y, [max_y, min_y], [0, h]
-                                        ),
-                                    )
-                                )
-                            lines_for_frame.append(
-                                threedee.Line3D(
-                                    Vector3(norm_pts[0][0], norm_pts[0][1], 0),
-                                    Vector3(norm_pts[1][0], norm_pts[1][1], 0),
-                                )
-                            )
-                            lines_for_frame_xflip.append(
-                                threedee.Line3D(
-                                    Vector3(
-                                        norm_pts_xflip[0][0], norm_pts_xflip[0][1], 0
-                                    ),
-                                    Vector3(
-                                        norm_pts_xflip[1][0], norm_pts_xflip[1][1], 0
-                                    ),
-                                )
-                            )
-                frames.append(lines_for_frame)
-                frames.append(lines_for_frame_xflip)
-            _CACHED_PLAYER_ART[anim_name] = frames
-        except Exception:
-            pass
+    all_pts = [
+        frame.reshape((-1, 2)) for frames in raw_art.values() for frame in frames
+    ]
+    if len(all_pts) == 0:
+        return {}
+    all_pts = numpy.concatenate(all_pts)
+    min_x, min_y = all_pts.min(axis=0)
+    max_x, max_y = all_pts.max(axis=0)
+
+    res = {}
+    for anim_name, frames in raw_art.items():
+        frame_offsets = numpy.cumsum([0] + [len(frame) for frame in frames])
+        if len(frames) > 0:
+            pts = numpy.concatenate(frames)
+        else:
+            pts = numpy.zeros((0, 2, 2))
+        x_amounts = (pts[:, :, 0] - min_x) / (max_x - min_x)
+        ys = (pts[:, :, 1] - max_y) / (min_y - max_y) * h
+        zs = numpy.zeros(ys.shape)
+
+        points = numpy.stack([x_amounts * w - w / 2, ys, zs], axis=2)
+        flipped_points = numpy.stack([x_amounts * -w + w / 2, ys, zs], axis=2)
+        res[anim_name] = (points, flipped_points, frame_offsets)
+    return res
+
+
+def compile_player_art(
+    path=PLAYER_ART_CACHE_PATH,
+    index_path=PLAYER_ART_CACHE_INDEX_PATH,
+    w=0.8,
+    h=0.5,
+    art_dir=PLAYER_ART_DIR,
+):
+    """Packs all the player's art into a single .npy file (which gets memory-mapped by load_player_art), along
+    with a small json index of where each animation's frames are. The index records a hash of the json files the
+    art was compiled from, so that development runs can tell when the cache is stale. Compiling the same sources
+    always produces the same files."""
+    json_paths = _get_player_art_json_paths(art_dir)
+    art = _read_player_art_from_json(json_paths, w, h)
+
+    all_points = []
+    all_flipped_points = []
+    animations = {}
+    n_lines = 0
+    for anim_name, (points, flipped_points, frame_offsets) in art.items():
+        all_points.append(points)
+        all_flipped_points.append(flipped_points)
+        animations[anim_name] = (frame_offsets + n_lines).tolist()
+        n_lines += len(points)
+
+    packed = numpy.zeros((2, n_lines, 2, 3))
+    if n_lines > 0:
+        packed[0] = numpy.concatenate(all_points)
+        packed[1] = numpy.concatenate(all_flipped_points)
+    numpy.save(path, packed)
+    with open(index_path, "w") as f:
+        json.dump(
+            {
+                "source_hash": _hash_player_art_sources(json_paths),
+                "size": [w, h],
+                "animations": animations,
+            },
+            f,
+            indent=4,
+        )
+    print("INFO: compiled player art into: {}".format(path))
+
+
+def _read_player_art_from_cache(path, index_path, w, h, json_paths=None):
+    """
+    :param json_paths: the json files the cache should be up to date with, or None to trust the cache as it is
+    :return: the same thing as _read_player_art_from_json (with the points being read-only views into the
+             memory-mapped cache), or None if the cache is missing or out of date.
+    """
+    safe_path = utility_functions.resource_path(path)
+    safe_index_path = utility_functions.resource_path(index_path)
+    if not os.path.exists(safe_path) or not os.path.exists(safe_index_path):
+        return None
+    try:
+        with open(safe_index_path) as f:
+            index = json.load(f)
+        if index["size"] != [w, h]:
+            return None
+        # if the json files weren't shipped, the cache is all we have
+        if json_paths is not None and any(
+            len(paths) > 0 for paths in json_paths.values()
+        ):
+            if index["source_hash"] != _hash_player_art_sources(json_paths):
+                print("INFO: player art cache is out of date: {}".format(path))
+                return None
+
+        packed = numpy.load(safe_path, mmap_mode="r")
+        res = {}
+        for anim_name, frame_offsets in index["animations"].items():
+            start, end = frame_offsets[0], frame_offsets[-1]
+            res[anim_name] = (
+                packed[0, start:end],
+                packed[1, start:end],
+                [offset - start for offset in frame_offsets],
+            )
+        return res
+    except Exception:
+        print("ERROR: failed to load player art cache: {}".format(path))
+        traceback.print_exc()
+        return None
 
 
-def get_player_shape_at_origin(player) -> List[threedee.Line3D]:
+def load_player_art(w=0.8, h=0.5):
+    # packaged builds ship the cache that was compiled alongside them, so only development runs (where the json
+    # files may have been edited since) need to check that it's up to date
+    is_packaged = config.Platform.IS_ANDROID or config.Platform.IS_FROZEN
+    json_paths = None if is_packaged else _get_player_art_json_paths()
+    art = _read_player_art_from_cache(
+        PLAYER_ART_CACHE_PATH, PLAYER_ART_CACHE_INDEX_PATH, w, h, json_paths=json_paths
+    )
+    if art is None:
+        if json_paths is None:
+            json_paths = _get_player_art_json_paths()
+        art = _read_player_art_from_json(json_paths, w, h)
+
+    for anim_name, (points, flipped_points, frame_offsets) in art.items():
+        # the keyframes are slices of the art's arrays, so nothing gets copied out of the cache
+        keyframes = []
+        flipped_keyframes = []
+        for i in range(len(frame_offsets) - 1):
+            keyframes.append(points[frame_offsets[i] : frame_offsets[i + 1]])
+            flipped_keyframes.append(
+                flipped_points[frame_offsets[i] : frame_offsets[i + 1]]
+            )
+        driven_by, frame_length = PLAYER_ANIMATION_TIMING.get(
+            anim_name, ("distance", 20)
+        )
+        _CACHED_PLAYER_ART[anim_name] = PlayerAnimation(
+            keyframes,
+            flipped_keyframes=flipped_keyframes,
+            frame_length=frame_length,
+            driven_by=driven_by,
+            interpolate=PLAYER_ANIMATION_INTERPOLATE,
+        )
+
+
+def get_player_shape_at_origin(player) -> threedee.LineBatch3D:
 
     player_mode = (
         player.get_mode()
@@ -279,35 +727,40 @@ def get_player_shape_at_origin(player) -> List[threedee.Line3D]:
         or len(_CACHED_PLAYER_ART[art_to_use]) == 0
     ):
         # just a rectangle
-        width = 0.5 if not player.is_sliding() else 0.6
-        height = 0.4 if not player.is_sliding() else 0.2
-        top_left = Vector3(-width / 2.0, height + dist_from_ground, 0)
-        top_right = Vector3(width / 2.0, height + dist_from_ground, 0)
-        bot_left = Vector3(-width / 2.0, dist_from_ground, 0)
-        bot_right = Vector3(width / 2.0, dist_from_ground, 0)
-
-        return [
-            threedee.Line3D(top_left, top_right, color=color, width=width),
-            threedee.Line3D(top_right, bot_right, color=color, width=width),
-            threedee.Line3D(bot_right, bot_left, color=color, width=width),
-            threedee.Line3D(bot_left, top_left, color=color, width=width),
-        ]
+        rect_width = 0.5 if not player.is_sliding() else 0.6
+        rect_height = 0.4 if not player.is_sliding() else 0.2
+        top_left = (-rect_width / 2.0, rect_height + dist_from_ground, 0)
+        top_right = (rect_width / 2.0, rect_height + dist_from_ground, 0)
+        bot_left = (-rect_width / 2.0, dist_from_ground, 0)
+        bot_right = (rect_width / 2.0, dist_from_ground, 0)
+
+        res = threedee.LineBatch3D(capacity=4)
+        res.add_lines(
+            [top_left, top_right, bot_right, bot_left],
+            [top_right, bot_right, bot_left, top_left],
+            color=color,
+            width=width,
+        )
+        return res
     else:
-        frame_n = int(player.z) // 20
-        all_frames = _CACHED_PLAYER_ART[art_to_use]
-        lines_in_frame = all_frames[frame_n % len(all_frames)]
-        return [
-            l.shift(dy=dist_from_ground, new_color=color, new_width=width)
-            for l in lines_in_frame
-        ]
-
-
-def get_player_shape(player, level) -> List[threedee.Line3D]:
+        anim = _CACHED_PLAYER_ART[art_to_use]
+        points = anim.get_points(anim.get_progress(player), dy=dist_from_ground)
+        res = threedee.LineBatch3D(capacity=len(points))
+        res.add_lines(points[:, 0], points[:, 1], color=color, width=width)
+        return res
+
+
+def get_player_shape(
+    player, level, out: Optional[threedee.LineBatch3D] = None
+) -> threedee.LineBatch3D:
+    """Builds the player's lines in world space. If out is given, the lines are appended to it."""
+    if out is None:
+        out = threedee.LineBatch3D()
     shape_2d = get_player_shape_at_origin(player)
     if player.is_dead():
         death_dur = player.get_time_dead()
         if death_dur > EXPLOSION_DURATION:
-            return []
+            return out
         elif death_dur > 0:
             shape_2d = blow_up(
                 shape_2d,
@@ -316,18 +769,20 @@ def get_player_shape(player, level) -> List[threedee.Line3D]:
                 2 * EXPLOSION_ROT_SPEED,
             )
     return align_shape_to_level_surface(
-        shape_2d, player.z, player.z, player.lane, level, squeeze=False
+        shape_2d, player.z, player.z, player.lane, level, squeeze=False, out=out
     )
 
 
 def align_shape_to_level_surface(
-    lines_to_xform: List[threedee.Line3D],
+    lines_to_xform: Union[List[threedee.Line3D], threedee.LineBatch3D],
     z_start: float,
     z_end: float,
     lane_n: int,
     level,
     squeeze=False,
-) -> List[threedee.Line3D]:
+    out: Optional[threedee.LineBatch3D] = None,
+    rotation=None,
+) -> threedee.LineBatch3D:
     """
     :param lines_to_xform: the shape to transform
     :param z_start: z position of the object in the level
@@ -336,67 +791,91 @@ def align_shape_to_level_surface(
     :param squeeze: whether the object should be "squeezed" inward as it approaches the center of the level
                     (this is needed for things like walls that should meet each other cleanly at their boundaries).
     :param level: the currently playing level
-    :return: a new set of Line3Ds, aligned to the level
+    :param out: if given, the aligned lines are appended to this batch
+    :param rotation: if given, overrides the level's rotation
+    :return: the aligned lines, as a LineBatch3D
     """
-    if z_start == z_end:
-        z_end += 0.001
-
-    near_ring_pts = get_ring_points(z_start, level)
-    far_ring_pts = get_ring_points(z_end, level)
-
-    near_left = near_ring_pts[(lane_n - 1) % level.number_of_lanes()]
-    near_right = near_ring_pts[lane_n % level.number_of_lanes()]
-    near_top = Vector3(0, 0, z_start)
-    near_bottom = (near_left + near_right) / 2
-
-    near_normal_vec = near_top - near_bottom
-    near_normal_vec.scale_to_length(1)
-
-    far_left = far_ring_pts[(lane_n - 1) % level.number_of_lanes()]
-    far_right = far_ring_pts[lane_n % level.number_of_lanes()]
-    far_top = Vector3(0, 0, z_end)
-    far_bottom = (far_left + far_right) / 2
-
-    far_normal_vec = far_top - far_bottom
-    far_normal_vec.scale_to_length(1)
-
-    res = []
-
-    def convert_pt(pt):
-        z_factor = utility_functions.map_from_interval_to_interval(
-            pt.z, [-1, 1], [0, 1]
-        )
-        vert_factor = pt.y
-        horz_factor = utility_functions.map_from_interval_to_interval(
-            pt.x, [-1, 1], [0, 1]
-        )
-
-        if not squeeze:
-            near_pt = (
-                near_left
-                + horz_factor * (near_right - near_left)
-                + vert_factor * (near_top - near_bottom)
-            )
-            far_pt = (
-                far_left
-                + horz_factor * (far_right - far_left)
-                + vert_factor * (far_top - far_bottom)
-            )
-            return utility_functions.lerp(z_factor, near_pt, far_pt)
-        else:
-            near_pt = utility_functions.lerp(
-                vert_factor,
-                near_left + horz_factor * (near_right - near_left),
-                near_top,
-            )
-            far_pt = utility_functions.lerp(
-                vert_factor, far_left + horz_factor * (far_right - far_left), far_top
-            )
-            return utility_functions.lerp(z_factor, near_pt, far_pt)
+    if out is None:
+        out = threedee.LineBatch3D()
+    if not isinstance(lines_to_xform, threedee.LineBatch3D):
+        lines_to_xform = threedee.LineBatch3D.from_line3ds(lines_to_xform)
+    if len(lines_to_xform) == 0:
+        return out
+
+    pts = align_shapes_to_level_surface(
+        lines_to_xform.points,
+        numpy.zeros(len(lines_to_xform) * 2, dtype=numpy.int64),
+        [z_start],
+        [z_end],
+        [lane_n],
+        squeeze,
+        level,
+        rotation=rotation,
+    )
+    out.add_lines(
+        pts[0::2], pts[1::2], color=lines_to_xform.colors, width=lines_to_xform.widths
+    )
+    return out
 
-    for l in lines_to_xform:
-        new_p1 = convert_pt(l.p1)
-        new_p2 = convert_pt(l.p2)
-        res.append(threedee.Line3D(new_p1, new_p2, color=l.color, width=l.width))
 
-    return res
+def align_shapes_to_level_surface(
+    points: numpy.ndarray,
+    shape_idxs: numpy.ndarray,
+    z_starts,
+    z_ends,
+    lanes,
+    squeeze,
+    level,
+    rotation=None,
+) -> numpy.ndarray:
+    """Aligns many shapes to the level's surface at once (see align_shape_to_level_surface).
+
+    Each point is bilinearly interpolated between its lane's edges (by x) and the lane's floor and the level's
+    center (by y), at both ends of the object, then linearly interpolated between the two ends (by z).
+
+    :param points: every shape's model-space points, packed into an (m, 3) array
+    :param shape_idxs: the index of the shape each point belongs to, as an (m,) array
+    :param z_starts: z position of each shape in the level
+    :param z_ends: end z position of each shape in the level
+    :param lanes: lane each shape is in
+    :param squeeze: whether each shape should be squeezed (either one bool per shape, or a single bool for all)
+    :param level: the currently playing level
+    :param rotation: if given, overrides the level's rotation
+    :return: the aligned points, as an (m, 3) array
+    """
+    z_starts = numpy.asarray(z_starts, dtype=numpy.float64)
+    z_ends = numpy.asarray(z_ends, dtype=numpy.float64)
+    z_ends = numpy.where(z_starts == z_ends, z_ends + 0.001, z_ends)
+    n_shapes = z_starts.shape[0]
+    n_lanes = level.number_of_lanes()
+    lanes = numpy.asarray(lanes, dtype=numpy.int64)
+
+    # index 0 is the near end of each shape, 1 is the far end: arrays of shape (2, n_shapes, 3)
+    rings = get_rings(numpy.concatenate([z_starts, z_ends]), level, rotation)
+    rings = rings.astype(numpy.float64).reshape((2, n_shapes, n_lanes, 3))
+    shape_range = numpy.arange(n_shapes)
+    lefts = rings[:, shape_range, (lanes - 1) % n_lanes]
+    rights = rings[:, shape_range, lanes % n_lanes]
+    tops = numpy.zeros((2, n_shapes, 3))
+    tops[0, :, 2] = z_starts
+    tops[1, :, 2] = z_ends
+    bottoms = (lefts + rights) / 2
+
+    points = numpy.asarray(points, dtype=numpy.float64)
+    squeeze = numpy.broadcast_to(numpy.asarray(squeeze, dtype=bool), (n_shapes,))[
+        shape_idxs
+    ]
+    horz_factor = ((points[:, 0] + 1) / 2)[:, None]
+    vert_factor = numpy.where(squeeze, numpy.clip(points[:, 1], 0, 1), points[:, 1])
+    z_factor = numpy.clip((points[:, 2] + 1) / 2, 0, 1)[:, None]
+
+    lefts = lefts[:, shape_idxs]
+    tops = tops[:, shape_idxs]
+    floor_pts = lefts + horz_factor * (rights[:, shape_idxs] - lefts)
+    up_vecs = numpy.where(
+        squeeze[:, None],
+        tops - floor_pts,  # squeezed shapes converge on the level's center
+        tops - bottoms[:, shape_idxs],
+    )
+    end_pts = floor_pts + vert_factor[:, None] * up_vecs
+    return end_pts[0] + z_factor * (end_pts[1] - end_pts[0])
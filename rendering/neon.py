@@ -1,8 +1,10 @@
-from typing import List, Iterable
+from typing import List, Iterable, Union, Optional
+import sys
 import pygame
 import cv2
 import numpy
 import config
+import util.profiling as profiling
 
 
 # taken from https://www.coolneon.com/wp-content/uploads/2014/11/color-chart.png
@@ -36,9 +38,8 @@ class NeonLine:
     ):
 
         self.vector_points = points
-        # x and y are flipped intentionally... this is what cv2 understands, don't ask me~
         self.np_points = numpy.array(
-            [[round(p.y), round(p.x)] for p in points], numpy.int32
+            [[round(p.x), round(p.y)] for p in points], numpy.int32
         ).reshape((-1, 1, 2))
         self.width = width
         self.inner_width = inner_width or 1
@@ -57,6 +58,131 @@ class NeonLine:
         ]
 
 
+def lerp_colors(colors: numpy.ndarray, target, amounts) -> numpy.ndarray:
+    """Vectorized version of pygame.Color.lerp (including its rounding).
+
+    :param colors: an (n, 3) array of RGB values
+    :param target: the color to lerp towards, either a single color or an (n, 3) array
+    :param amounts: a value from 0 to 1, either a single value or an (n,) array
+    :return: an (n, 3) uint8 array of the lerped colors
+    """
+    colors = colors.astype(numpy.float32)
+    target = numpy.asarray(target, dtype=numpy.float32)[..., :3]
+    amounts = numpy.asarray(amounts, dtype=numpy.float32)
+    if amounts.ndim == 1:
+        amounts = amounts[:, None]
+    res = numpy.floor(colors + (target - colors) * amounts + 0.5)
+    return numpy.clip(res, 0, 255).astype(numpy.uint8)
+
+
+class NeonLineBatch:
+    """
+    Represents many lines NeonRenderer can draw, stored as arrays rather than NeonLine objects.
+    This is what Camera3D.project_batch_to_surface produces.
+    """
+
+    def __init__(
+        self,
+        points: numpy.ndarray,
+        widths: numpy.ndarray,
+        colors: numpy.ndarray,
+        inner_colors: numpy.ndarray = None,
+        inner_widths: numpy.ndarray = None,
+    ):
+        n = points.shape[0]
+        self.points = points  # (n, 2, 2) float array of screen coordinates, as (x, y)
+        self.widths = widths  # (n,) int array
+        self.colors = colors  # (n, 3) uint8 array of RGB values
+        if inner_colors is None:
+            inner_colors = numpy.empty((n, 3), dtype=numpy.uint8)
+            inner_colors[...] = (WHITE[0], WHITE[1], WHITE[2])
+        self.inner_colors = inner_colors
+        if inner_widths is None:
+            inner_widths = numpy.ones((n,), dtype=numpy.int32)
+        self.inner_widths = inner_widths
+
+    def __len__(self):
+        return self.points.shape[0]
+
+    def get_cv2_points(self, scale=1) -> numpy.ndarray:
+        """:return: the points (multiplied by scale) rounded to ints, in the (n, 2, 2) layout cv2.polylines
+        understands."""
+        points = self.points
+        if scale != 1:
+            points = points * scale
+        return numpy.rint(points).astype(numpy.int32)
+
+    @staticmethod
+    def from_neon_lines(lines: Iterable[NeonLine]) -> "NeonLineBatch":
+        """Converts NeonLines into a batch. Lines with more than two points are split into their segments."""
+        points, widths, colors, inner_colors, inner_widths = [], [], [], [], []
+        for line in lines:
+            pts = line.vector_points
+            for i in range(len(pts) - 1):
+                points.append(((pts[i][0], pts[i][1]), (pts[i + 1][0], pts[i + 1][1])))
+                widths.append(line.width)
+                colors.append((line.color[0], line.color[1], line.color[2]))
+                inner_colors.append(
+                    (line.inner_color[0], line.inner_color[1], line.inner_color[2])
+                )
+                inner_widths.append(line.inner_width)
+        return NeonLineBatch(
+            numpy.array(points, dtype=numpy.float32).reshape((-1, 2, 2)),
+            numpy.array(widths, dtype=numpy.int32),
+            numpy.array(colors, dtype=numpy.uint8).reshape((-1, 3)),
+            inner_colors=numpy.array(inner_colors, dtype=numpy.uint8).reshape((-1, 3)),
+            inner_widths=numpy.array(inner_widths, dtype=numpy.int32),
+        )
+
+
+def _to_channels(colors: numpy.ndarray, channels, n_channels) -> numpy.ndarray:
+    """Rearranges (n, 3) RGB colors into the channel layout of a buffer.
+
+    :param channels: the indices of the red, green and blue channels in the buffer
+    :param n_channels: how many channels the buffer has
+    """
+    if n_channels == 3 and tuple(channels) == (0, 1, 2):
+        return colors
+    res = numpy.zeros((colors.shape[0], n_channels), dtype=numpy.uint8)
+    res[:, list(channels)] = colors
+    return res
+
+
+def _scale_kernel(kernel, downsample):
+    """:return: the blur kernel to use in a buffer that's downsample times smaller, so the result looks about the
+    same once it's scaled back up."""
+    if kernel is None or downsample == 1:
+        return kernel
+    res = []
+    for k in kernel:
+        k = max(1, round(k / downsample))
+        res.append(k if k % 2 == 1 else k - 1)  # gotta be odd
+    return tuple(res)
+
+
+def _scale_widths(widths, downsample):
+    """Scales line widths down for a buffer that's downsample times smaller. Thin lines can't get any thinner, so
+    they're dimmed instead, to keep the glow about as bright. Lines that got rounded down to a thinner width are
+    left as they are, not brightened.
+
+    :return: (scaled_widths, dimming), where dimming is how much (from 0 to 1) to dim each line by
+    """
+    scaled_widths = numpy.maximum(1, numpy.rint(widths / downsample))
+    dimming = numpy.clip(1 - widths / (scaled_widths * downsample), 0, 1)
+    return scaled_widths, dimming
+
+
+def darken(array, darkness_factor):
+    """darkens the image (in place)
+    :param darkness_factor: a value from 0 to 1 that determines how dark it will be
+    """
+    if darkness_factor < 1:
+        # apparently multiplying by a float is too expensive (ask bydario~)
+        denominator = 100
+        numerator = int(darkness_factor * denominator)
+        array[...] = array // denominator * numerator
+
+
 class NeonRenderer:
     """
     A class that renders lines with a cool neon effect.
@@ -67,80 +193,216 @@ class NeonRenderer:
         ambient_bloom_kernel=(15, 15),
         mid_tone_bloom_kernel=(3, 3),
         highlight_bloom_kernel=None,
+        bloom_downsample=None,
+        draw_in_place=True,
     ):
+        """
+        :param bloom_downsample: how much smaller (1, 2 or 4) the buffer the glow passes are drawn and blurred in is,
+                                 compared to the target surface. The kernels are scaled down to match. If None,
+                                 config.Display.bloom_downsample is used.
+        :param draw_in_place: whether to draw straight into the target surface's pixels (when its pixel format
+                              allows it), instead of into an offscreen buffer that then gets blitted onto it.
+        """
         self.ambient_bloom_kernel = ambient_bloom_kernel
         self.mid_tone_bloom_kernel = mid_tone_bloom_kernel
         self.highlight_bloom_kernel = highlight_bloom_kernel
+        self.bloom_downsample = bloom_downsample
+        self.draw_in_place = draw_in_place
         self.darkness_factor = 1  # this is pretty krangled now, off by default~
 
-        self._buf = None  # a buffer for intermediate drawing operations
+        # all buffers are row-major, i.e. shaped (height, width, channels)
+        self._layers = {}  # name -> buffer for intermediate drawing operations
+        self._offscreen = (
+            None  # a Surface sharing its pixels with self._layers["offscreen"]
+        )
 
     def draw_lines(
         self,
         surface: pygame.Surface,
-        lines: Iterable[NeonLine],
+        lines: Union[Iterable[NeonLine], NeonLineBatch],
         extra_darkness_factor=1,
     ):
         """Draws lines with a fancy neon effect.
 
         :param surface: the surface to draw them onto
-        :param lines: the lines to draw
+        :param lines: the lines to draw, either as NeonLines or as a NeonLineBatch
         :param extra_darkness_factor: a value from 0 to 1 that will control the 'extra darkness' of the lines (0 being
         completely dark).
         """
+        batch = (
+            lines
+            if isinstance(lines, NeonLineBatch)
+            else NeonLineBatch.from_neon_lines(lines)
+        )
         if not config.Debug.use_neon:
-            for line in lines:
-                pygame.draw.lines(
-                    surface, line.color, False, line.vector_points, width=line.width
+            points = batch.points.tolist()
+            widths = batch.widths.tolist()
+            colors = batch.colors.tolist()
+            for i in range(len(batch)):
+                pygame.draw.line(
+                    surface, colors[i], points[i][0], points[i][1], width=widths[i]
                 )
             return
 
-        if (
-            self._buf is None
-            or (self._buf.shape[0], self._buf.shape[1]) != surface.get_size()
-        ):
-            self._buf = pygame.surfarray.array3d(surface)
+        width, height = surface.get_size()
+        buf = self._get_pixel_view(surface) if self.draw_in_place else None
+        if buf is not None:
+            channels = self._get_channel_indices(surface)
+        else:
+            buf = self._get_offscreen_buffer((width, height))
+            channels = (0, 1, 2)
+        n_channels = buf.shape[2]
+
+        cv2_points = batch.get_cv2_points()
+        dark_colors = lerp_colors(batch.colors, BLACK, 0.15)
+        mid_colors = batch.colors
+        mid_widths = batch.inner_widths
+
+        downsample = self.get_bloom_downsample()
+        if downsample == 1:
+            glow_points = cv2_points
+            glow_widths = batch.widths
+            glow_buf = self._get_layer("glow", (height, width, n_channels))
+            mid_buf = buf
+        else:
+            # the glow passes are drawn in a smaller buffer, then scaled back up
+            low_shape = (
+                max(1, height // downsample),
+                max(1, width // downsample),
+                n_channels,
+            )
+            glow_points = batch.get_cv2_points(scale=1 / downsample)
+            glow_buf = self._get_layer("glow", low_shape)
+            mid_buf = self._get_layer("mid", low_shape)
 
-        # fill screen with black
-        self._buf[...] = 0
+            glow_widths, glow_dimming = _scale_widths(batch.widths, downsample)
+            dark_colors = lerp_colors(dark_colors, BLACK, glow_dimming)
+            mid_widths, mid_dimming = _scale_widths(batch.inner_widths, downsample)
+            mid_colors = lerp_colors(mid_colors, BLACK, mid_dimming)
 
-        # Ghast's Neon Line Drawing Algorithm (modified by bydariogamer)
-        # 1st pass, draw large, dark, faint glow around line
-        for line in lines:
-            self.polylines(
-                self._buf,
-                [line.np_points],
-                False,
-                line.color.lerp((0, 0, 0), 0.15),
-                line.width,
-            )
-        self._blur(self._buf, self.ambient_bloom_kernel)
+        dark_colors = _to_channels(dark_colors, channels, n_channels)
+        mid_colors = _to_channels(mid_colors, channels, n_channels)
+        inner_colors = _to_channels(batch.inner_colors, channels, n_channels)
 
-        # 2nd pass, draw smaller, brighter glow
-        for line in lines:
-            self.polylines(
-                self._buf, [line.np_points], False, line.color, line.inner_width
-            )
-        self._blur(self._buf, self.mid_tone_bloom_kernel)
+        timer = profiling.get_frame_timer()
+
+        # Ghast's Neon Line Drawing Algorithm (modified by bydariogamer)
+        # 1st pass, draw large, dark, faint glow around line (on its own layer)
+        with timer.stage("neon.glow"):
+            glow_buf[...] = 0
+            self._draw_grouped(glow_buf, glow_points, dark_colors, glow_widths)
+            self._blur(glow_buf, _scale_kernel(self.ambient_bloom_kernel, downsample))
+
+        # 2nd pass, draw smaller, brighter glow, then composite the 1st pass underneath it
+        with timer.stage("neon.mid_tone"):
+            mid_buf[...] = 0
+            self._draw_grouped(mid_buf, glow_points, mid_colors, mid_widths)
+            cv2.max(mid_buf, glow_buf, dst=mid_buf)
+            self._blur(mid_buf, _scale_kernel(self.mid_tone_bloom_kernel, downsample))
+
+            if mid_buf is not buf:
+                cv2.resize(
+                    mid_buf, (width, height), dst=buf, interpolation=cv2.INTER_LINEAR
+                )
 
         # 3rd pass, draw anti-aliased highlight
-        for line in lines:
-            self.polylines(
-                self._buf,
-                [line.np_points],
-                False,
-                line.inner_color,
-                line.inner_width,
+        with timer.stage("neon.highlight"):
+            self._draw_grouped(
+                buf,
+                cv2_points,
+                inner_colors,
+                batch.inner_widths,
                 lineType=cv2.LINE_AA,
             )
 
         # bydariogamer's idea
-        # self._buf = cv2.GaussianBlur(self._buf, (9, 9), 0.0005)
+        # buf = cv2.GaussianBlur(buf, (9, 9), 0.0005)
+
+        with timer.stage("neon.blit"):
+            # post processing effects
+            self._darken(buf, self.darkness_factor * extra_darkness_factor)
+
+            if self._offscreen is not None and buf is self._layers["offscreen"]:
+                surface.blit(self._offscreen, (0, 0))
 
-        # post processing effects
-        self._darken(self._buf, self.darkness_factor * extra_darkness_factor)
+    def get_bloom_downsample(self) -> int:
+        res = (
+            self.bloom_downsample
+            if self.bloom_downsample is not None
+            else config.Display.bloom_downsample
+        )
+        return max(1, int(res))
+
+    def _get_layer(self, name, shape) -> numpy.ndarray:
+        """:return: a preallocated (height, width, channels) buffer for one of the rendering passes."""
+        layer = self._layers.get(name)
+        if layer is None or layer.shape != shape:
+            layer = numpy.zeros(shape, dtype=numpy.uint8)
+            self._layers[name] = layer
+        return layer
+
+    def _get_offscreen_buffer(self, size) -> numpy.ndarray:
+        """:return: an RGB buffer that self._offscreen shares its pixels with."""
+        shape = (size[1], size[0], 3)
+        if self._offscreen is None or self._layers["offscreen"].shape != shape:
+            buf = self._get_layer("offscreen", shape)
+            self._offscreen = pygame.image.frombuffer(buf, size, "RGB")
+        return self._layers["offscreen"]
+
+    @staticmethod
+    def _get_pixel_view(surface: pygame.Surface) -> Optional[numpy.ndarray]:
+        """
+        :return: a (height, width, 4) view of the surface's pixels, or None if its pixel format doesn't allow it.
+                 The surface stays locked for as long as the view is alive.
+        """
+        width, height = surface.get_size()
+        if (
+            surface.get_bytesize() != 4
+            or surface.get_pitch() != width * 4
+            or surface.get_flags() & pygame.SRCALPHA
+        ):
+            return None
+        pixels = numpy.frombuffer(surface.get_buffer(), dtype=numpy.uint8)
+        return pixels.reshape((height, width, 4))
 
-        pygame.surfarray.blit_array(surface, self._buf)
+    @staticmethod
+    def _get_channel_indices(surface: pygame.Surface):
+        """:return: the byte offsets of the red, green and blue channels within one of the surface's pixels."""
+        res = []
+        for shift in surface.get_shifts()[:3]:
+            byte = shift // 8
+            res.append(byte if sys.byteorder == "little" else 3 - byte)
+        return tuple(res)
+
+    def _draw_grouped(self, array, cv2_points, colors, widths, lineType=cv2.LINE_4):
+        """Draws the lines with one polylines call per distinct (color, width) pair.
+        Groups are drawn in the order they first appear, so later lines still end up on top (mostly).
+        """
+        n = cv2_points.shape[0]
+        if n == 0:
+            return
+        keys = widths.astype(numpy.int64) & 0xFFFFFF
+        for c in range(colors.shape[1]):
+            keys = (keys << 8) | colors[:, c]
+        _, first_idxs, group_ids = numpy.unique(
+            keys, return_index=True, return_inverse=True
+        )
+        group_ids = group_ids.reshape(-1)
+        order = numpy.argsort(group_ids, kind="stable")
+        boundaries = numpy.searchsorted(
+            group_ids[order], numpy.arange(len(first_idxs) + 1)
+        )
+        for g in numpy.argsort(first_idxs).tolist():
+            idxs = order[boundaries[g] : boundaries[g + 1]]
+            first = first_idxs[g]
+            self.polylines(
+                array,
+                cv2_points[idxs],
+                False,
+                colors[first].tolist(),
+                int(widths[first]),
+                lineType=lineType,
+            )
 
     @staticmethod
     def polylines(array, pts, connected, color, width, lineType=cv2.LINE_4):
@@ -159,14 +421,7 @@ class NeonRenderer:
 
     @staticmethod
     def _darken(array, darkness_factor):
-        """darkens the image
-        :param darkness_factor: a value from 0 to 1 that determines how dark it will be
-        """
-        if darkness_factor < 1:
-            # apparently multiplying by a float is too expensive (ask bydario~)
-            denominator = 100
-            numerator = int(darkness_factor * denominator)
-            array[...] = array // denominator * numerator
+        darken(array, darkness_factor)
 
 
 if __name__ == "__main__":
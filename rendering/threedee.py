@@ -65,6 +65,141 @@ class Line3D:
         return res
 
 
+def rgb(color):
+    """Returns the (r, g, b) part of a color-like value (e.g. a pygame.Color or a 3- or 4-tuple)."""
+    return color[0], color[1], color[2]
+
+
+class LineBatch3D:
+    """
+    A growable, struct-of-arrays collection of 3D lines.
+
+    Instead of one Line3D (and two Vector3s) per line, the endpoints of every line live in a single contiguous
+    float32 array, with the colors packed as uint8 RGB rows and the widths as int32s. Line i's endpoints are at
+    points[2 * i] and points[2 * i + 1]. Batches are meant to be cleared and refilled every frame, so the
+    underlying buffers only get reallocated when they need to grow.
+    """
+
+    def __init__(self, capacity=64):
+        capacity = max(1, capacity)
+        self._points = numpy.empty((capacity * 2, 3), dtype=numpy.float32)
+        self._colors = numpy.empty((capacity, 3), dtype=numpy.uint8)
+        self._widths = numpy.empty((capacity,), dtype=numpy.int32)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def __repr__(self):
+        return "{}(size={}, capacity={})".format(
+            type(self).__name__, self._size, self.capacity()
+        )
+
+    def capacity(self):
+        return self._widths.shape[0]
+
+    @property
+    def points(self) -> numpy.ndarray:
+        """the endpoints of the lines in the batch, as a (2 * len(self), 3) array."""
+        return self._points[: self._size * 2]
+
+    @property
+    def colors(self) -> numpy.ndarray:
+        """the colors of the lines in the batch, as a (len(self), 3) array of RGB values."""
+        return self._colors[: self._size]
+
+    @property
+    def widths(self) -> numpy.ndarray:
+        """the widths of the lines in the batch, as a (len(self),) array."""
+        return self._widths[: self._size]
+
+    def clear(self):
+        """Empties the batch (without releasing its buffers)."""
+        self._size = 0
+
+    def reserve(self, n_lines):
+        """Makes sure the batch can hold n_lines more lines without reallocating."""
+        needed = self._size + n_lines
+        if needed <= self.capacity():
+            return
+        new_capacity = max(needed, self.capacity() * 2)
+
+        points = numpy.empty((new_capacity * 2, 3), dtype=numpy.float32)
+        points[: self._size * 2] = self._points[: self._size * 2]
+        colors = numpy.empty((new_capacity, 3), dtype=numpy.uint8)
+        colors[: self._size] = self._colors[: self._size]
+        widths = numpy.empty((new_capacity,), dtype=numpy.int32)
+        widths[: self._size] = self._widths[: self._size]
+
+        self._points, self._colors, self._widths = points, colors, widths
+
+    def add_line(self, p1, p2, color=neon.WHITE, width=1):
+        self.reserve(1)
+        i = self._size
+        self._points[i * 2] = (p1[0], p1[1], p1[2])
+        self._points[i * 2 + 1] = (p2[0], p2[1], p2[2])
+        self._colors[i] = rgb(color)
+        self._widths[i] = width
+        self._size += 1
+
+    def add_lines(self, p1s, p2s, color=neon.WHITE, width=1):
+        """Adds many lines at once.
+
+        :param p1s: the lines' first endpoints, as an (n, 3) array
+        :param p2s: the lines' second endpoints, as an (n, 3) array
+        :param color: either a single color for all the lines, or an (n, 3) array of RGB values
+        :param width: either a single width for all the lines, or an (n,) array of widths
+        """
+        n = len(p1s)
+        if n == 0:
+            return
+        self.reserve(n)
+        start, end = self._size, self._size + n
+        self._points[start * 2 : end * 2 : 2] = p1s
+        self._points[start * 2 + 1 : end * 2 : 2] = p2s
+        if isinstance(color, numpy.ndarray):
+            self._colors[start:end] = color
+        else:
+            self._colors[start:end] = rgb(color)
+        self._widths[start:end] = width
+        self._size = end
+
+    def add_line3ds(self, lines: Iterable["Line3D"]):
+        for l in lines:
+            self.add_line(l.p1, l.p2, color=l.color, width=l.width)
+
+    def extend(self, other: "LineBatch3D"):
+        n = len(other)
+        if n == 0:
+            return
+        self.reserve(n)
+        start, end = self._size, self._size + n
+        self._points[start * 2 : end * 2] = other.points
+        self._colors[start:end] = other.colors
+        self._widths[start:end] = other.widths
+        self._size = end
+
+    def to_line3ds(self) -> List["Line3D"]:
+        pts = self.points.tolist()
+        colors = self.colors.tolist()
+        widths = self.widths.tolist()
+        return [
+            Line3D(
+                Vector3(pts[i * 2]),
+                Vector3(pts[i * 2 + 1]),
+                color=pygame.Color(*colors[i]),
+                width=widths[i],
+            )
+            for i in range(self._size)
+        ]
+
+    @staticmethod
+    def from_line3ds(lines: List["Line3D"]) -> "LineBatch3D":
+        res = LineBatch3D(capacity=len(lines))
+        res.add_line3ds(lines)
+        return res
+
+
 class Line2D:
     def __init__(
         self, p1: Vector2, p2: Vector2, color=neon.WHITE, inner_color=None, width=1
@@ -136,6 +271,9 @@ class Camera3D:
         self.up: Vector3 = Vector3(0, -1, 0)
         self.fov_degrees: float = 45  # vertical field of view
 
+        # points closer to the camera than this (in clip space) are clipped away
+        self.near_clip_w: float = 0.1
+
     def __repr__(self):
         return "{}(pos={}, dir={})".format(
             type(self).__name__, self.position, self.direction
@@ -153,60 +291,97 @@ class Camera3D:
         )
         return proj_mat @ view_mat
 
-    def project_to_surface(
-        self, surface, lines: List[Line3D], depth_shading=None
-    ) -> List[Line2D]:
-        res = []
+    def project_to_surface(self, surface, lines, depth_shading=None) -> List[Line2D]:
+        """
+        :param lines: the lines to project, either as a LineBatch3D or a list of Line3Ds
+        :return: the projected lines, as Line2Ds. See project_batch_to_surface for an array-based version.
+        """
+        batch = self.project_batch_to_surface(surface, lines, depth_shading)
+        points = batch.points.tolist()
+        colors = batch.colors.tolist()
+        inner_colors = batch.inner_colors.tolist()
+        widths = batch.widths.tolist()
+        return [
+            Line2D(
+                Vector2(points[i][0]),
+                Vector2(points[i][1]),
+                color=pygame.Color(*colors[i]),
+                inner_color=pygame.Color(*inner_colors[i]),
+                width=widths[i],
+            )
+            for i in range(len(batch))
+        ]
+
+    def project_batch_to_surface(
+        self, surface, lines, depth_shading=None
+    ) -> neon.NeonLineBatch:
+        """Projects lines onto the surface, using whole-array operations.
+
+        Lines that cross the near plane are clipped against it, and lines that are entirely behind it are dropped.
+
+        :param lines: the lines to project, either as a LineBatch3D or a list of Line3Ds
+        :param depth_shading: if given, a (start, end) pair of distances from the camera. Lines fade towards black
+                              between the two distances.
+        :return: the visible lines, in screen coordinates.
+        """
+        if not isinstance(lines, LineBatch3D):
+            lines = LineBatch3D.from_line3ds(lines)
+
         screen_dims = surface.get_size()
         camera_xform = self.get_xform(screen_dims)
-        point_list = numpy.ndarray((len(lines) * 2, 4), dtype=numpy.float32)
-        for i in range(len(lines) * 2):
-            pt = lines[i // 2].p1 if i % 2 == 0 else lines[i // 2].p2
-            point_list[i] = (pt[0], pt[1], pt[2], 1)
-
-        point_list = point_list.transpose()
-        point_list = camera_xform.dot(point_list)
-        point_list = point_list.transpose()
-
-        for i in range(len(lines)):
-            w1 = point_list[i * 2][3]
-            w2 = point_list[i * 2 + 1][3]
-            if w1 > 0.001 and w2 > 0.001:
-                x1 = screen_dims[0] * (0.5 + point_list[i * 2][0] / w1)
-                y1 = screen_dims[1] * (0.5 + point_list[i * 2][1] / w1)
-                x2 = screen_dims[0] * (0.5 + point_list[i * 2 + 1][0] / w2)
-                y2 = screen_dims[1] * (0.5 + point_list[i * 2 + 1][1] / w2)
-                p1 = Vector2(x1, y1)
-                p2 = Vector2(x2, y2)
-                if depth_shading is None:
-                    inner_color = neon.WHITE
-                    line_color = lines[i].color
-                else:
-                    depth = ((lines[i].p1 + lines[i].p2) / 2 - self.position).length()
-                    if depth <= depth_shading[0]:
-                        inner_color = neon.WHITE
-                        line_color = lines[i].color
-                    elif depth >= depth_shading[1]:
-                        inner_color = neon.BLACK
-                        line_color = neon.BLACK
-                    else:
-                        lerp_amt = (depth - depth_shading[0]) / (
-                            depth_shading[1] - depth_shading[0]
-                        )
-                        line_color = lines[i].color.lerp(neon.BLACK, lerp_amt)
-                        inner_color = neon.WHITE.lerp(neon.BLACK, lerp_amt)
-
-                res.append(
-                    Line2D(
-                        p1,
-                        p2,
-                        color=line_color,
-                        inner_color=inner_color,
-                        width=lines[i].width,
-                    )
-                )
+        n_lines = len(lines)
+        points_3d = lines.points
 
-        return res
+        # (x, y, w) of each endpoint in clip space, shape = (n_lines, 2, 3)
+        xyw_xform = camera_xform[[0, 1, 3]]
+        clip_pts = (points_3d @ xyw_xform[:, :3].T + xyw_xform[:, 3]).reshape(
+            (n_lines, 2, 3)
+        )
+        p1 = clip_pts[:, 0]
+        p2 = clip_pts[:, 1]
+        p1_visible = p1[:, 2] > self.near_clip_w
+        p2_visible = p2[:, 2] > self.near_clip_w
+        visible = p1_visible | p2_visible
+
+        # clip lines with one endpoint behind the near plane (interpolating in clip space is fine, it's linear)
+        needs_clip = visible & (p1_visible != p2_visible)
+        if needs_clip.any():
+            c1 = p1[needs_clip]
+            c2 = p2[needs_clip]
+            t = (self.near_clip_w - c1[:, 2]) / (c2[:, 2] - c1[:, 2])
+            clipped_pt = c1 + t[:, None] * (c2 - c1)
+            clipped_pt[:, 2] = self.near_clip_w
+            c1_visible = p1_visible[needs_clip][:, None]
+            clip_pts[needs_clip, 0] = numpy.where(c1_visible, c1, clipped_pt)
+            clip_pts[needs_clip, 1] = numpy.where(c1_visible, clipped_pt, c2)
+
+        clip_pts = clip_pts[visible]
+        screen_pts = clip_pts[:, :, :2] / clip_pts[:, :, 2:3]
+        screen_pts += 0.5
+        screen_pts *= numpy.array(screen_dims, dtype=numpy.float32)
+
+        colors = lines.colors[visible]
+        widths = lines.widths[visible]
+        if depth_shading is None:
+            inner_colors = None
+        else:
+            centers = (points_3d[0::2][visible] + points_3d[1::2][visible]) / 2
+            depths = numpy.linalg.norm(
+                centers - numpy.array(self.position, dtype=numpy.float32), axis=1
+            )
+            lerp_amts = numpy.clip(
+                (depths - depth_shading[0]) / (depth_shading[1] - depth_shading[0]),
+                0,
+                1,
+            )
+            colors = neon.lerp_colors(colors, neon.BLACK, lerp_amts)
+            inner_colors = neon.lerp_colors(
+                numpy.array([rgb(neon.WHITE)], dtype=numpy.uint8),
+                neon.BLACK,
+                lerp_amts,
+            )
+
+        return neon.NeonLineBatch(screen_pts, widths, colors, inner_colors=inner_colors)
 
 
 def gen_cube(angle, size, center, color):
@@ -0,0 +1,32 @@
+import numpy
+
+import rendering.levelbuilder3d as levelbuilder3d
+
+
+def _make_animation(interpolate):
+    keyframes = [
+        numpy.array([[[0.2, 0.0, 0.0], [0.4, 0.5, 0.0]]]),
+        numpy.array([[[0.1, 0.0, 0.0], [0.3, 0.5, 0.0]]]),
+    ]
+    flipped_keyframes = [pts * (-1, 1, 1) for pts in keyframes]
+    return levelbuilder3d.PlayerAnimation(
+        keyframes, flipped_keyframes=flipped_keyframes, interpolate=interpolate
+    )
+
+
+def test_animation_alternates_keyframes_with_their_mirror_images():
+    anim = _make_animation(interpolate=False)
+    assert len(anim) == 4
+    for progress, (pts, i) in enumerate(
+        [(anim.keyframes, 0), (anim.flipped_keyframes, 0), (anim.keyframes, 1)]
+    ):
+        assert numpy.array_equal(anim.get_points(progress + 0.5), pts[i])
+
+
+def test_interpolation_never_blends_a_keyframe_with_its_mirror_image():
+    anim = _make_animation(interpolate=True)
+    for progress in numpy.linspace(0, 4, 41):
+        xs = anim.get_points(progress)[:, :, 0]
+        # the player's lines are all on one side of x = 0, and would collapse onto it if blended with their mirror
+        assert numpy.all(numpy.abs(xs) >= 0.1)
+    assert numpy.allclose(anim.get_points(1)[0, 0], (-0.15, 0.0, 0.0))
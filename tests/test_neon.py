@@ -0,0 +1,32 @@
+import numpy
+import pygame
+
+import rendering.neon as neon
+
+
+def test_lerp_colors_saturates_instead_of_wrapping():
+    colors = numpy.array([[217, 85, 0]])
+    res = neon.lerp_colors(colors, neon.BLACK, -0.25)
+    assert res.tolist() == [[255, 106, 0]]
+
+
+def test_dimming_stays_between_0_and_1():
+    widths = numpy.array([1, 2, 3, 5, 6, 8])
+    for downsample in (2, 4):
+        scaled, dimming = neon._scale_widths(widths, downsample)
+        assert (scaled >= 1).all()
+        assert ((dimming >= 0) & (dimming <= 1)).all()
+        widened = scaled * downsample > widths
+        assert (dimming[widened] > 0).all()
+        assert (dimming[~widened] == 0).all()
+
+
+def test_downsampled_glow_keeps_its_hue():
+    surface = pygame.Surface((64, 32))
+    line = neon.NeonLine([pygame.Vector2(8, 16), pygame.Vector2(56, 16)], 5, neon.WHITE)
+    for downsample in (2, 4):
+        surface.fill((0, 0, 0))
+        neon.NeonRenderer(bloom_downsample=downsample).draw_lines(surface, [line])
+        pixels = pygame.surfarray.array3d(surface).astype(int)
+        # WHITE is bluish, so its glow should be too (and not wrap around to dark blue)
+        assert (pixels[..., 2] >= pixels[..., 0]).all()
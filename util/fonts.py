@@ -1,3 +1,6 @@
+import collections
+import string
+
 import pygame
 import time
 import util.utility_functions as utils
@@ -7,6 +10,13 @@ import config
 _DISP_WID = config.Display.width
 _CACHED_FONTS = {}  # (size: int, bold: bool, font_name: str) -> Font
 
+_TEXT_CACHE_SIZE = 256
+# (font, text, antialias, color) -> Surface, least recently used first
+_CACHED_TEXT = collections.OrderedDict()
+
+_ATLAS_CHARS = string.digits + string.ascii_letters + string.punctuation + " "
+_CACHED_ATLASES = {}  # (font, antialias, color) -> GlyphAtlas
+
 _FONT_PATHS = {
     "lame": "assets/fonts/CONSOLA.TTF",
     "lame_bold": "assets/fonts/CONSOLAB.TTF",
@@ -30,6 +40,125 @@ def get_font(size, name="lame", bold=False, normalized=True):
     return _CACHED_FONTS[key]
 
 
+def render_text(font: pygame.font.Font, text, antialias, color) -> pygame.Surface:
+    """Same as font.render, but the surfaces are cached (the least recently used ones get evicted).
+    Don't draw on the returned surface, it's shared."""
+    key = (font, text, antialias, tuple(color))
+    surface = _CACHED_TEXT.get(key)
+    if surface is None:
+        surface = font.render(text, antialias, color)
+        _CACHED_TEXT[key] = surface
+        if len(_CACHED_TEXT) > _TEXT_CACHE_SIZE:
+            _CACHED_TEXT.popitem(last=False)
+    else:
+        _CACHED_TEXT.move_to_end(key)
+    return surface
+
+
+class GlyphAtlas:
+    """A font's common characters, rasterized once, side by side on a single surface. Text made of only those
+    characters is drawn by blitting each character's part of the atlas, so nothing gets rasterized per frame.
+    Kerning is ignored, which makes no difference for the game's fonts."""
+
+    def __init__(self, font: pygame.font.Font, antialias, color, chars=_ATLAS_CHARS):
+        glyphs = []
+        for ch, metrics in zip(chars, font.metrics(chars)):
+            if metrics is not None:
+                glyphs.append((ch, font.render(ch, antialias, color), metrics[4]))
+
+        self.height = max(glyph.get_height() for _, glyph, _ in glyphs)
+        size = (sum(glyph.get_width() for _, glyph, _ in glyphs), self.height)
+        if antialias:
+            self.surface = pygame.Surface(size, pygame.SRCALPHA)
+        else:
+            # without antialiasing, every pixel is either fully opaque or fully transparent, so a colorkey is
+            # enough (and it's about twice as fast to blit as per-pixel alpha)
+            key = [255 - c for c in pygame.Color(color)[:3]]
+            self.surface = pygame.Surface(size)
+            self.surface.fill(key)
+            self.surface.set_colorkey(key)
+        self.areas = {}  # char -> the Rect of its glyph in the atlas
+        self.advances = {}  # char -> how far to move right after drawing it
+        x = 0
+        for ch, glyph, advance in glyphs:
+            self.areas[ch] = self.surface.blit(glyph, (x, 0))
+            self.advances[ch] = advance
+            x += glyph.get_width()
+        self.chars = frozenset(self.areas)
+
+    def can_draw(self, text):
+        return self.chars.issuperset(text)
+
+    def size(self, text):
+        return sum(self.advances[ch] for ch in text), self.height
+
+    def draw(self, screen: pygame.Surface, text, pos) -> pygame.Rect:
+        """Draws the text with its top left corner at pos. All of its characters must be in the atlas."""
+        x, y = pos
+        blits = []
+        for ch in text:
+            blits.append((self.surface, (x, y), self.areas[ch]))
+            x += self.advances[ch]
+        screen.blits(blits, doreturn=False)
+        return pygame.Rect(pos[0], y, x - pos[0], self.height)
+
+
+def get_glyph_atlas(font: pygame.font.Font, antialias, color) -> GlyphAtlas:
+    key = (font, antialias, tuple(color))
+    if key not in _CACHED_ATLASES:
+        _CACHED_ATLASES[key] = GlyphAtlas(font, antialias, color)
+    return _CACHED_ATLASES[key]
+
+
+def draw_text(
+    screen: pygame.Surface, font, text, antialias, color, pos, centered=False
+) -> pygame.Rect:
+    """Draws text using the font's glyph atlas, or a cached surface if the atlas is missing some of its characters.
+
+    :param pos: where the text's top left corner goes, or its center if centered is True
+    :return: the area that was drawn to
+    """
+    atlas = get_glyph_atlas(font, antialias, color)
+    if atlas.can_draw(text):
+        size = atlas.size(text)
+        if centered:
+            pos = (pos[0] - size[0] // 2, pos[1] - size[1] // 2)
+        return atlas.draw(screen, text, pos)
+    else:
+        surface = render_text(font, text, antialias, color)
+        if centered:
+            return screen.blit(surface, surface.get_rect(center=pos))
+        return screen.blit(surface, pos)
+
+
+class MenuLayout:
+    """Lines of horizontally centered text, positioned once when they're added. A line's surface is only
+    looked up again when its text or color changes."""
+
+    def __init__(self, width):
+        self.width = width
+        self.lines = []  # list of [font, text, antialias, color, surface, rect]
+
+    def add_line(self, font, text, y, color=(255, 255, 255), antialias=True) -> int:
+        """:return: the index of the new line"""
+        surface = render_text(font, text, antialias, color)
+        rect = surface.get_rect(topleft=(self.width // 2 - surface.get_width() // 2, y))
+        self.lines.append([font, text, antialias, color, surface, rect])
+        return len(self.lines) - 1
+
+    def get_rect(self, idx) -> pygame.Rect:
+        return self.lines[idx][5]
+
+    def set_color(self, idx, color):
+        line = self.lines[idx]
+        if line[3] != color:
+            line[3] = color
+            line[4] = render_text(line[0], line[1], line[2], color)
+
+    def draw(self, screen: pygame.Surface):
+        screen.blits([(line[4], line[5]) for line in self.lines], doreturn=False)
+
+
 class Text:
     def __init__(
         self,
@@ -48,7 +177,7 @@ class Text:
         self.y = y
         self.size = size
         self.color = color
-        self.text = get_font(self.size, name="cool").render(self.msg, False, self.color)
+        self.font = get_font(self.size, name="cool")
         self.blink = blink
         self.blink_timer = time.time()
         self.visible = True
@@ -60,11 +189,12 @@ class Text:
                 self.blink_timer = time.time()
                 self.visible = not self.visible
         if self.visible:
-            if self.centered:
-                self.display.blit(
-                    self.text, self.text.get_rect(center=(self.x, self.y))
-                )
-            else:
-                self.display.blit(
-                    self.text, self.text.get_rect(topleft=(self.x, self.y))
-                )
+            draw_text(
+                self.display,
+                self.font,
+                self.msg,
+                False,
+                self.color,
+                (self.x, self.y),
+                centered=self.centered,
+            )
@@ -1,6 +1,14 @@
 # base code
 import cProfile
 import pstats
+import csv
+import math
+import time
+import traceback
+
+import numpy
+
+import util.fonts as fonts
 
 _instance = None
 
@@ -34,3 +42,163 @@ class Profiler:
             print("INFO\tstarted profiling...")
             self.pr.clear()
             self.pr.enable()
+
+
+_frame_timer = None
+
+
+def get_frame_timer():
+    global _frame_timer
+    if _frame_timer is None:
+        _frame_timer = FrameTimer()
+
+    return _frame_timer
+
+
+class _NullStage:
+    """Used in place of a _Stage when the frame timer is off."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+        self.t0 = 0
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.timer.add_time(self.name, (time.perf_counter() - self.t0) * 1000)
+        return False
+
+
+class FrameTimer:
+    """Keeps track of how long each stage of the last few hundred frames took.
+
+    usage:
+        with get_frame_timer().stage("update"):
+            ...
+        get_frame_timer().end_frame()  # once per frame
+    """
+
+    def __init__(self, history=600):
+        self.enabled = False
+        self.history = history  # number of frames to keep
+
+        self._stage_idxs = {}  # stage name -> column in self._samples
+        self._samples = numpy.full((history, 0), numpy.nan)  # in milliseconds
+        self._n_frames = 0  # total number of frames recorded
+        self._current = {}  # stage name -> milliseconds spent on it so far this frame
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        print("INFO: frame timer {}".format("on" if self.enabled else "off"))
+        if self.enabled:
+            self.clear()
+
+    def clear(self):
+        self._stage_idxs = {}
+        self._samples = numpy.full((self.history, 0), numpy.nan)
+        self._n_frames = 0
+        self._current = {}
+
+    def stage(self, name):
+        """:return: a context manager that times the code inside it as part of the given stage."""
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def add_time(self, name, millis):
+        self._current[name] = self._current.get(name, 0) + millis
+
+    def end_frame(self):
+        if not self.enabled:
+            return
+        for name in self._current:
+            if name not in self._stage_idxs:
+                self._stage_idxs[name] = len(self._stage_idxs)
+                self._samples = numpy.hstack(
+                    [self._samples, numpy.full((self.history, 1), numpy.nan)]
+                )
+        row = self._samples[self._n_frames % self.history]
+        row[...] = numpy.nan
+        for name, millis in self._current.items():
+            row[self._stage_idxs[name]] = millis
+        self._n_frames += 1
+        self._current = {}
+
+    def get_stage_names(self):
+        return list(self._stage_idxs.keys())
+
+    def get_samples(self, name) -> numpy.ndarray:
+        """:return: the stage's recorded times (in ms), oldest first, for the frames it ran in."""
+        if name not in self._stage_idxs:
+            return numpy.empty((0,))
+        n = min(self._n_frames, self.history)
+        start = self._n_frames % self.history if self._n_frames > self.history else 0
+        col = numpy.roll(self._samples[:n, self._stage_idxs[name]], -start)
+        return col[~numpy.isnan(col)]
+
+    def get_percentiles(self, name, percentiles=(50, 95, 99)):
+        """:return: the given percentiles of the stage's times (in ms), or None if it has no samples."""
+        samples = self.get_samples(name)
+        if len(samples) == 0:
+            return None
+        return tuple(numpy.percentile(samples, percentiles).tolist())
+
+    def draw_overlay(self, surface, budget_ms=None):
+        """Draws a table of each stage's p50 / p95 / p99 times onto the surface.
+
+        :param budget_ms: if given, stages whose p95 is above this are drawn in red
+        """
+        if not self.enabled:
+            return
+        font = fonts.get_font(14, normalized=False)
+        rows = ["{:<16}{:>7}{:>7}{:>7}".format("stage (ms)", "p50", "p95", "p99")]
+        over_budget = [False]
+        for name in self.get_stage_names():
+            p = self.get_percentiles(name)
+            if p is not None:
+                rows.append("{:<16}{:>7.2f}{:>7.2f}{:>7.2f}".format(name, *p))
+                over_budget.append(budget_ms is not None and p[1] > budget_ms)
+
+        y = 4
+        for text, is_over in zip(rows, over_budget):
+            color = (255, 64, 64) if is_over else (255, 255, 255)
+            text_surface = font.render(text, False, color, (0, 0, 0))
+            surface.blit(
+                text_surface, (surface.get_width() - text_surface.get_width() - 4, y)
+            )
+            y += text_surface.get_height()
+
+    def export_csv(self, path="frame_times.csv"):
+        """Writes the recorded times to a csv file, one row per frame and one column per stage."""
+        names = self.get_stage_names()
+        n = min(self._n_frames, self.history)
+        start = self._n_frames % self.history if self._n_frames > self.history else 0
+        rows = numpy.roll(self._samples[:n], -start, axis=0)
+        try:
+            with open(path, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(["frame"] + names)
+                first_frame = self._n_frames - n
+                for i, row in enumerate(rows.tolist()):
+                    writer.writerow(
+                        [first_frame + i]
+                        + ["" if math.isnan(v) else "{:.3f}".format(v) for v in row]
+                    )
+            print("INFO: saved frame times to: {}".format(path))
+        except Exception:
+            print("ERROR: failed to save frame times to: {}".format(path))
+            traceback.print_exc()